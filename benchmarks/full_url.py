@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the time taken by `Site.full_url` for every resource, the way a
+feed or a sitemap template calls the `full_url` filter. The first section
+of the generated content is configured as the media folder so that both
+media and content urls are computed.
+
+`$ python benchmarks/full_url.py --resources 20000 --passes 5`
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hyde.model import Config  # NOQA
+from hyde.site import Site  # NOQA
+
+from load_site import make_site  # NOQA
+
+
+def render_sitemap(site, paths):
+    """
+    Calls `full_url` for the path of every resource once.
+    """
+    for path in paths:
+        site.full_url(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--resources', type=int, default=20000)
+    parser.add_argument('--per-folder', type=int, default=50)
+    parser.add_argument('--passes', type=int, default=5,
+                        help='The number of times every url is computed')
+    args = parser.parse_args()
+    root = tempfile.mkdtemp(prefix='hyde-bench-')
+    try:
+        sitepath = make_site(root, args.resources, args.per_folder)
+        site = Site(sitepath, Config(sitepath, config_dict=dict(
+            media_root='section0', media_url='http://media.example.com')))
+        site.load()
+        paths = [resource.relative_path
+                 for resource in site.content.walk_resources()]
+        media = sum(1 for path in paths if site.is_media(path))
+        start = time.time()
+        for _ in range(args.passes):
+            render_sitemap(site, paths)
+        seconds = time.time() - start
+    finally:
+        shutil.rmtree(root)
+    calls = len(paths) * args.passes
+    print('Computed %d full urls (%d media resources) in %.3f seconds' %
+          (calls, media, seconds))
+    print('Time per url: %.2f us' % (seconds * 1000000 / max(calls, 1)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the time and the peak resident memory taken to generate a large
+site, with and without the low memory mode. Every build runs in its own
+process: a full build followed by an incremental build that finds nothing
+to do.
+
+`$ python benchmarks/generate_site.py --resources 20000`
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hyde.model import Config  # NOQA
+from hyde.site import Site  # NOQA
+from hyde.util import peak_memory  # NOQA
+
+CONFIG = """\
+mode: production
+plugins:
+    - hyde.ext.plugins.meta.MetaPlugin
+    - hyde.ext.plugins.meta.AutoExtendPlugin
+"""
+
+LAYOUT = """\
+<html><head><title>{{ resource.meta.title }}</title></head>
+<body>{% block content %}{% endblock %}</body></html>
+"""
+
+PAGE = """\
+---
+title: Page %(index)d
+extends: base.j2
+default_block: content
+tags: [a, b%(tag)d]
+---
+%(body)s
+"""
+
+
+def make_site(root, resources, per_folder, size):
+    """
+    Creates a site with the given number of pages of about `size` bytes,
+    spread over folders with `per_folder` pages each.
+    """
+    os.makedirs(os.path.join(root, 'layout'))
+    with open(os.path.join(root, 'site.yaml'), 'w') as config:
+        config.write(CONFIG)
+    with open(os.path.join(root, 'layout', 'base.j2'), 'w') as layout:
+        layout.write(LAYOUT)
+    content = os.path.join(root, 'content')
+    body = ('<p>%s</p>\n' % ('lorem ipsum ' * 8)) * max(size // 110, 1)
+    for index in range(resources):
+        folder = os.path.join(content, 'folder%d' % (index // per_folder))
+        if index % per_folder == 0:
+            os.makedirs(folder)
+        with open(os.path.join(folder, 'page%d.html' % index), 'w') as page:
+            page.write(PAGE % dict(index=index, tag=index % 100, body=body))
+    return root
+
+
+def generate(sitepath, low_memory):
+    from hyde.generator import Generator
+    site = Site(sitepath, Config(sitepath))
+    site.config.low_memory = low_memory
+    generator = Generator(site)
+    start = time.time()
+    generator.generate_all(incremental=True)
+    generator.manifest.save()
+    print('%.2f %d %d' % (time.time() - start, generator.stats['generated'],
+                          peak_memory() or 0))
+
+
+def run(sitepath, low_memory):
+    command = [sys.executable, os.path.abspath(__file__),
+               '--sitepath', sitepath, '--generate']
+    if low_memory:
+        command.append('--low-memory')
+    output = subprocess.check_output(command).decode('utf-8')
+    seconds, generated, peak = output.split()[-3:]
+    return float(seconds), int(generated), int(peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--resources', type=int, default=5000)
+    parser.add_argument('--per-folder', type=int, default=100)
+    parser.add_argument('--size', type=int, default=4096,
+                        help='The size of every page in bytes')
+    parser.add_argument('--sitepath', help=argparse.SUPPRESS)
+    parser.add_argument('--generate', action='store_true',
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--low-memory', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.generate:
+        return generate(args.sitepath, args.low_memory)
+    mb = 1024.0 * 1024.0
+    for low_memory in (False, True):
+        root = tempfile.mkdtemp(prefix='hyde-bench-')
+        try:
+            sitepath = make_site(os.path.join(root, 'site'), args.resources,
+                                 args.per_folder, args.size)
+            mode = 'low memory' if low_memory else 'default'
+            for build in ('full', 'incremental'):
+                seconds, generated, peak = run(sitepath, low_memory)
+                print('%s, %s build: %d pages in %.2f seconds, '
+                      'peak memory %.1f MB' %
+                      (mode, build, generated, seconds, peak / mb))
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
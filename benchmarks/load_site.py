@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the time and the peak memory taken to load a large site.
+
+`$ python benchmarks/load_site.py --resources 200000`
+"""
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hyde.model import Config  # NOQA
+from hyde.site import Site  # NOQA
+
+
+def make_site(root, resources, per_folder):
+    """
+    Creates a content folder with the given number of files, spread over
+    nested folders with `per_folder` files each.
+    """
+    content = os.path.join(root, 'content')
+    for index in range(resources):
+        folder = index // per_folder
+        folder = os.path.join(content, 'section%d' % (folder // 100),
+                              'folder%d' % folder)
+        if index % per_folder == 0:
+            os.makedirs(folder)
+        with open(os.path.join(folder, 'page%d.html' % index), 'w') as page:
+            page.write('page')
+    return root
+
+
+def measure(sitepath):
+    site = Site(sitepath, Config(sitepath, config_dict={}))
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    site.load()
+    seconds = time.time() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(site.content.resource_map)
+    return count, seconds, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--resources', type=int, default=50000)
+    parser.add_argument('--per-folder', type=int, default=50)
+    parser.add_argument('--sitepath',
+                        help='Load an existing site instead of generating one')
+    args = parser.parse_args()
+    root = None
+    sitepath = args.sitepath
+    if not sitepath:
+        root = tempfile.mkdtemp(prefix='hyde-bench-')
+        sitepath = make_site(root, args.resources, args.per_folder)
+    try:
+        count, seconds, current, peak = measure(sitepath)
+    finally:
+        if root:
+            shutil.rmtree(root)
+    mb = 1024.0 * 1024.0
+    print('Loaded %d resources in %.2f seconds' % (count, seconds))
+    print('Memory held by the model: %.1f MB (%d bytes per resource)' %
+          (current / mb, current // max(count, 1)))
+    print('Peak memory while loading: %.1f MB' % (peak / mb))
+
+
+if __name__ == '__main__':
+    main()
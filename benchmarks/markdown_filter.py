@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the time taken to render pages that call the `markdown` filter
+many times. Every page is rendered with a new converter for every call,
+the way the filter used to work, with a shared converter and with the
+outputs of the filter already cached.
+
+`$ python benchmarks/markdown_filter.py --pages 200 --calls 30`
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import markdown as md  # NOQA
+from jinja2 import environmentfilter  # NOQA
+
+from hyde.ext.templates.jinja import Jinja2Template, markdown  # NOQA
+from hyde.model import Config  # NOQA
+from hyde.site import Site  # NOQA
+
+PAGE = """
+{% for section in sections %}
+{{ section|markdown }}
+{% endfor %}
+"""
+
+SECTION = """
+### Section %(page)d.%(call)d
+
+Some *emphasis*, a [link](http://example.com/%(page)d/%(call)d) and a list:
+
+* one
+* two
+* three
+
+> A quote about section %(call)d.
+"""
+
+
+@environmentfilter
+def markdown_per_call(env, value):
+    """
+    Converts the text with a new converter, as the filter used to.
+    """
+    return md.Markdown(extensions=list(env.config.markdown.extensions)
+                       ).convert(value)
+
+
+def render(template, pages, calls):
+    """
+    Renders every page and returns the time taken.
+    """
+    start = time.time()
+    for page in range(pages):
+        sections = [SECTION % dict(page=page, call=call)
+                    for call in range(calls)]
+        template.render(PAGE, dict(sections=sections))
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--calls', type=int, default=30,
+                        help='The number of markdown calls on every page')
+    args = parser.parse_args()
+    sitepath = os.path.dirname(os.path.abspath(__file__))
+    site = Site(sitepath, Config(sitepath, config_dict=dict(
+        markdown=dict(extensions=['extra', 'toc']))))
+    template = Jinja2Template(sitepath)
+    template.configure(site)
+
+    results = []
+    template.env.filters['markdown'] = markdown_per_call
+    results.append(('New converter per call', render(
+        template, args.pages, args.calls)))
+    template.env.filters['markdown'] = markdown
+    results.append(('Shared converter', render(
+        template, args.pages, args.calls)))
+    results.append(('Cached output', render(
+        template, args.pages, args.calls)))
+    print('Rendered %d pages with %d markdown calls each' %
+          (args.pages, args.calls))
+    for name, seconds in results:
+        print('%-24s %.2f ms per page' %
+              (name + ':', seconds * 1000 / args.pages))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the time taken to compute the urls of the resources the way a
+navigation loop in a template does.
+
+`$ python benchmarks/urls.py --resources 2000 --pages 50`
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hyde.model import Config  # NOQA
+from hyde.site import Site  # NOQA
+
+from load_site import make_site  # NOQA
+
+
+def render_navigation(site):
+    """
+    Touches the paths and urls of every resource once, like a
+    sitemap or a navigation menu rendered on one page.
+    """
+    for resource in site.content.walk_resources():
+        resource.relative_path
+        resource.url
+        resource.full_url
+        resource.node.full_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--resources', type=int, default=2000)
+    parser.add_argument('--per-folder', type=int, default=50)
+    parser.add_argument('--pages', type=int, default=50,
+                        help='The number of pages that render the navigation')
+    args = parser.parse_args()
+    root = tempfile.mkdtemp(prefix='hyde-bench-')
+    try:
+        sitepath = make_site(root, args.resources, args.per_folder)
+        site = Site(sitepath, Config(sitepath, config_dict={}))
+        site.load()
+        start = time.time()
+        for _ in range(args.pages):
+            render_navigation(site)
+        seconds = time.time() - start
+    finally:
+        shutil.rmtree(root)
+    print('Rendered the urls of %d resources on %d pages in %.3f seconds' %
+          (args.resources, args.pages, seconds))
+    print('Time per page: %.2f ms' % (seconds * 1000 / args.pages))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@
 # These lines are being marked with ``# NOQA`` to allow flake8 checking
 # to pass.
 
+import os
 import sys
 
 PY3 = sys.version_info.major == 3
@@ -19,6 +20,7 @@ if PY3:
     from io import StringIO  # NOQA
     from urllib import parse  # NOQA
     from urllib.parse import quote, unquote  # NOQA
+    from os import replace, scandir  # NOQA
 
     # Types that have changed name.
     filter = filter  # NOQA
@@ -63,6 +65,17 @@ else:
 
     exec('def reraise(tp, value, tb=None):\n raise tp, value, tb')
 
+    try:
+        from scandir import scandir  # NOQA
+    except ImportError:
+        scandir = None
+
+    def replace(src, dst):
+        """Python 2 replacement for ``os.replace``."""
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
 
 def iteritems(d):
     """Return iterable items from a dict."""
@@ -86,6 +86,20 @@ class Engine(Application):
            help='Where should the site be generated?')
     @true('-r', '--regen', dest='regen', default=False,
           help='Regenerate the whole site, including unchanged files')
+    @store('-j', '--jobs', type=int, default=1, dest='jobs',
+           help='Number of processes used to generate the resources. '
+                'Use 0 to start one process per core.')
+    @store('--changed', nargs='+', dest='changed', default=None,
+           metavar='PATH',
+           help='Regenerate only the resources affected by changes to '
+                'the given files')
+    @store('--profile', dest='profile', default=None, metavar='PATH',
+           help='Write the time spent in each plugin hook and resource '
+                'to PATH as JSON and next to it as text')
+    @true('--low-memory', dest='low_memory', default=False,
+          help='Release the source text, the hashes and the cached '
+               'references of every resource as soon as it is written, '
+               'and load the site without the snapshot')
     def gen(self, args):
         """
         The generate command. Generates the site at the given
@@ -93,14 +107,53 @@ class Engine(Application):
         """
         sitepath = self.main(args)
         site = self.make_site(sitepath, args.config, args.deploy)
+        if args.low_memory:
+            site.config.low_memory = True
         from hyde.generator import Generator
-        gen = Generator(site)
+        profiler = None
+        if args.profile:
+            from hyde.profiler import Profiler
+            profiler = Profiler()
+        gen = Generator(site, jobs=args.jobs, profiler=profiler)
         incremental = True
         if args.regen:
             self.logger.info("Regenerating the site...")
             incremental = False
-        gen.generate_all(incremental=incremental)
+        if args.changed and incremental:
+            gen.generate_affected(args.changed)
+        else:
+            gen.generate_all(incremental=incremental)
         self.logger.info("Generation complete.")
+        if profiler:
+            profiler.save(args.profile)
+            self.logger.info(profiler.report())
+
+    @subcommand('watch', help='Regenerate the site when it changes')
+    @store('-c', '--config-path', default='site.yaml', dest='config',
+           help='The configuration used to generate the site')
+    @store('-d', '--deploy-path', dest='deploy', default=None,
+           help='Where should the site be generated?')
+    @true('--poll', dest='poll', default=False,
+          help='Poll for changes instead of using inotify')
+    @store('-i', '--interval', type=float, default=0.5, dest='interval',
+           help='Seconds between checks when polling for changes')
+    def watch(self, args):
+        """
+        The watch command. Generates the site and keeps it in memory,
+        regenerating the affected resources whenever the content, the
+        layouts or the configuration change.
+        """
+        sitepath = self.main(args)
+        site = self.make_site(sitepath, args.config, args.deploy)
+        from hyde.generator import Generator
+        from hyde.watcher import Watcher
+        watcher = Watcher(site, Generator(site), poll=args.poll,
+                          interval=args.interval)
+        self.logger.info("Watching [%s] for changes", sitepath)
+        try:
+            watcher.watch()
+        except (KeyboardInterrupt, SystemExit):
+            self.logger.info("Stopped watching for changes")
 
     @subcommand('serve', help='Serve the website')
     @store('-a', '--address', default='localhost', dest='address',
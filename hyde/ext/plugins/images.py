@@ -8,7 +8,6 @@ Contains classes to handle images related things
 from hyde.plugin import CLTransformer, Plugin
 
 
-import glob
 import os
 import re
 
@@ -16,6 +15,7 @@ from fswrap import File
 
 from hyde._compat import str
 from hyde.exceptions import HydeException
+from hyde.util import glob_matcher
 
 
 class PILPlugin(Plugin):
@@ -382,9 +382,7 @@ class ImageThumbnailsPlugin(PILPlugin):
                         preserve_orientation = True
                         dim1, dim2 = larger, smaller
 
-                    def match_includes(s):
-                        return any([glob.fnmatch.fnmatch(s, inc)
-                                    for inc in include])
+                    match_includes = glob_matcher(include)
 
                     for resource in node.resources:
                         if match_includes(resource.path):
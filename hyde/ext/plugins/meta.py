@@ -3,6 +3,7 @@
 Contains classes and utilities related to meta data in hyde.
 """
 
+import codecs
 from collections import namedtuple
 from functools import partial
 from operator import attrgetter
@@ -77,8 +78,8 @@ class MetaPlugin(Plugin):
         """
         Initialize site meta data.
 
-        Go through all the nodes and resources to initialize
-        meta data at each level.
+        Go through all the nodes to initialize their meta data. The meta
+        data of a resource is read the first time it is used.
         """
         config = self.site.config
         metadata = config.meta if hasattr(config, 'meta') else {}
@@ -89,28 +90,99 @@ class MetaPlugin(Plugin):
         for node in self.site.content.walk():
             self.__read_node__(node)
             for resource in node.resources:
-                if not hasattr(resource, 'meta'):
-                    resource.meta = Metadata({}, node.meta)
-                if resource.source_file.is_text and not resource.simple_copy:
-                    self.__read_resource__(
-                        resource, resource.source_file.read_all())
+                resource.set_loader(self.__load_resource__)
 
-    def __read_resource__(self, resource, text):
+    def resource_added(self, resource):
         """
-        Reads the resource metadata and assigns it to
-        the resource. Load meta data by looking for the marker.
-        Once loaded, remove the meta area from the text.
+        Initializes the meta data of the nodes that were added along with
+        the resource, or of its node if the resource is the node meta data
+        file. The meta data of the resource is read the first time it is
+        used.
+        """
+        if not hasattr(self.site, 'meta'):
+            return
+        for node in reversed(list(resource.node.rwalk())):
+            if not hasattr(node, 'meta'):
+                self.__read_node__(node)
+        if resource.name == self.nodemeta:
+            self.__read_node__(resource.node)
+        resource.set_loader(self.__load_resource__)
+
+    def __load_resource__(self, resource):
+        """
+        Initializes the meta data of the resource from the meta data
+        of its node and its front matter.
+        """
+        if not hasattr(resource, 'meta'):
+            resource.meta = Metadata({}, resource.node.meta)
+        if resource.source_file.is_text and not resource.simple_copy:
+            self.__set_metadata__(
+                resource, self.__read_front_matter__(resource))
+
+    def __parse_front_matter__(self, resource, text):
+        """
+        Looks for the meta data marker in the text. Returns the text
+        without the meta area and the parsed meta data.
         """
         self.logger.debug(
             "Trying to load metadata from resource [%s]" % resource)
         match = re.match(self.yaml_finder, text)
         if not match:
             self.logger.debug("No metadata found in resource [%s]" % resource)
-            data = {}
-        else:
-            text = text[match.end():]
-            data = match.group(1)
+            return text, {}
+        return text[match.end():], yaml.load(match.group(1))
+
+    def __read_front_matter__(self, resource):
+        """
+        Returns the parsed meta data of the resource. The meta data in
+        the site snapshot is used if the file has not changed.
+        """
+        def parse(path):
+            return self.__parse_front_matter__(
+                resource, self.__read_header__(path))[1]
+
+        snapshot = getattr(self.site, 'snapshot', None)
+        if snapshot:
+            return snapshot.read(resource.path, 'meta', parse)
+        return parse(resource.path)
+
+    def __read_header__(self, path):
+        """
+        Reads the file at the given path up to the end of the meta data
+        area. Nothing more than the first line is read if the file does
+        not start with a meta data marker.
+        """
+        lines = []
+        opened = False
+        with codecs.open(path, 'r', 'utf-8') as stream:
+            for line in stream:
+                lines.append(line)
+                stripped = line.strip()
+                if not stripped:
+                    continue
+                if not opened:
+                    if stripped not in ('---', '==='):
+                        break
+                    opened = True
+                elif stripped.startswith(('---', '===')) and \
+                        re.match(self.yaml_finder, ''.join(lines)):
+                    break
+        return ''.join(lines)
 
+    def __read_resource__(self, resource, text):
+        """
+        Reads the resource metadata and assigns it to
+        the resource. Load meta data by looking for the marker.
+        Once loaded, remove the meta area from the text.
+        """
+        text, data = self.__parse_front_matter__(resource, text)
+        self.__set_metadata__(resource, data)
+        return text or ' '
+
+    def __set_metadata__(self, resource, data):
+        """
+        Assigns the parsed meta data to the resource.
+        """
         if not hasattr(resource, 'meta') or not resource.meta:
             if not hasattr(resource.node, 'meta'):
                 resource.node.meta = Metadata({})
@@ -120,7 +192,6 @@ class MetaPlugin(Plugin):
         self.__update_standard_attributes__(resource)
         self.logger.debug("Successfully loaded metadata from resource [%s]"
                           % resource)
-        return text or ' '
 
     def __update_standard_attributes__(self, obj):
         """
@@ -143,7 +214,13 @@ class MetaPlugin(Plugin):
         parent_meta = node.parent.meta if node.parent else self.site.meta
         if nodemeta:
             nodemeta.is_processable = False
-            metadata = nodemeta.source_file.read_all()
+            snapshot = getattr(self.site, 'snapshot', None)
+            if snapshot:
+                metadata = snapshot.read(
+                    nodemeta.path, 'nodemeta',
+                    lambda path: yaml.load(nodemeta.read_source()))
+            else:
+                metadata = nodemeta.read_source()
             if hasattr(node, 'meta') and node.meta:
                 node.meta.update(metadata)
             else:
@@ -67,6 +67,10 @@ class SphinxPlugin(Plugin):
 
     """The plugin class for rendering sphinx-generated documentation."""
 
+    # Sphinx is run once, from the first resource, into a build folder
+    # that is removed in `site_complete`.
+    parallel_safe = False
+
     def __init__(self, site):
         self.sphinx_build_dir = None
         self._sphinx_config = None
@@ -7,12 +7,11 @@ from hyde._compat import reduce
 from hyde.ext.plugins.meta import Metadata
 from hyde.plugin import Plugin
 from hyde.site import Resource
-from hyde.util import pairwalk
+from hyde.util import glob_matcher, pairwalk
 
 from fswrap import File, Folder
 
 import os
-from fnmatch import fnmatch
 import operator
 
 
@@ -128,12 +127,14 @@ class CombinePlugin(Plugin):
             sort = True
 
         if sort:
-            resources = sorted([r for r in walker
-                                if any(fnmatch(r.name, f) for f in files)],
+            matches = glob_matcher(files)
+            resources = sorted([r for r in walker if matches(r.name)],
                                key=operator.attrgetter('name'))
         else:
+            matchers = [(f, glob_matcher([f])) for f in files]
             resources = [(f, r)
-                         for r in walker for f in files if fnmatch(r.name, f)]
+                         for r in walker for f, matches in matchers
+                         if matches(r.name)]
             resources = [r[1] for f in files for r in resources if f in r]
 
         if not resources:
@@ -188,9 +189,9 @@ class CombinePlugin(Plugin):
             "Combining %d resources for [%s]" % (len(resources),
                                                  resource))
         if where == "top":
-            return "".join([r.source.read_all() for r in resources] + [text])
+            return "".join([r.read_source() for r in resources] + [text])
         else:
-            return "".join([text] + [r.source.read_all() for r in resources])
+            return "".join([text] + [r.read_source() for r in resources])
 
 
 #
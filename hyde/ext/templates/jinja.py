@@ -3,8 +3,11 @@
 Jinja template utilties
 """
 
+from collections import OrderedDict
 from datetime import datetime, date
+import hashlib
 import itertools
+import json
 import os
 import re
 import sys
@@ -12,18 +15,24 @@ import sys
 from hyde._compat import PY3, quote, unquote, str, StringIO
 from hyde.exceptions import HydeException
 from hyde.model import Expando
+from hyde.site import Node, Resource
 from hyde.template import HtmlWrap, Template
+from hyde.util import write_atomically
+from hyde.version import __version__
 from operator import attrgetter
 
+import jinja2
 from jinja2 import (
     contextfunction,
     Environment,
     FileSystemLoader,
     FileSystemBytecodeCache
 )
+from jinja2.bccache import Bucket
 from jinja2 import contextfilter, environmentfilter, Markup, Undefined, nodes
 from jinja2.ext import Extension
 from jinja2.exceptions import TemplateError
+from jinja2.meta import find_referenced_templates
 
 from commando.util import getLoggerWithNullHandler
 
@@ -141,6 +150,21 @@ def asciidoc(env, value):
     return str(result.getvalue(), "utf-8")
 
 
+_markdown_converters = {}
+
+
+def markdown_converter(md, settings):
+    """
+    Returns a converter for the given settings. Converters are created
+    once for every distinct set of settings and reset before every use.
+    """
+    key = json.dumps(settings, default=repr, sort_keys=True)
+    marked = _markdown_converters.get(key)
+    if marked is None:
+        marked = _markdown_converters[key] = md.Markdown(**settings)
+    return marked.reset()
+
+
 @environmentfilter
 def markdown(env, value):
     """
@@ -160,9 +184,15 @@ def markdown(env, value):
                                          Expando({})).to_dict()
         if hasattr(env.config.markdown, 'output_format'):
             d['output_format'] = env.config.markdown.output_format
-    marked = md.Markdown(**d)
 
-    return marked.convert(output)
+    def convert(text):
+        return markdown_converter(md, d).convert(text)
+
+    cache = getattr(env, 'render_cache', None)
+    if cache is None:
+        return convert(output)
+    version = getattr(md, '__version__', getattr(md, 'version', ''))
+    return cache.render('markdown', [version, d], output, convert)
 
 
 @environmentfilter
@@ -192,6 +222,33 @@ def restructuredtext(env, value):
     return parts['html_body']
 
 
+_pygments_lexers = {}
+_pygments_formatters = {}
+
+
+def pygments_lexer(lexers, name):
+    """
+    Returns the lexer with the given name, creating it the first time.
+    """
+    lexer = _pygments_lexers.get(name)
+    if lexer is None:
+        lexer = _pygments_lexers[name] = lexers.get_lexer_by_name(name)
+    return lexer
+
+
+def pygments_formatter(formatters, settings):
+    """
+    Returns an html formatter for the given settings, creating it the
+    first time.
+    """
+    key = json.dumps(settings, default=repr, sort_keys=True)
+    formatter = _pygments_formatters.get(key)
+    if formatter is None:
+        formatter = _pygments_formatters[key] = formatters.HtmlFormatter(
+            **settings)
+    return formatter
+
+
 @environmentfilter
 def syntax(env, value, lexer=None, filename=None):
     """
@@ -206,26 +263,34 @@ def syntax(env, value, lexer=None, filename=None):
                      " use syntax highlighting tags.")
         raise TemplateError("Cannot load pygments")
 
-    pyg = (lexers.get_lexer_by_name(lexer)
-           if lexer else
-           lexers.guess_lexer(value))
     settings = {}
+    use_figure = True
     if hasattr(env.config, 'syntax'):
         settings = getattr(env.config.syntax,
                            'options',
                            Expando({})).to_dict()
-
-    formatter = formatters.HtmlFormatter(**settings)
-    code = pygments.highlight(value, pyg, formatter)
-    code = code.replace('\n\n', '\n&nbsp;\n').replace('\n', '<br />')
-    caption = filename if filename else pyg.name
-    if hasattr(env.config, 'syntax'):
-        if not getattr(env.config.syntax, 'use_figure', True):
-            return Markup(code)
-    return Markup(
-        '<div class="codebox"><figure class="code">%s<figcaption>'
-        '%s</figcaption></figure></div>\n\n'
-        % (code, caption))
+        use_figure = getattr(env.config.syntax, 'use_figure', True)
+
+    def highlight(text):
+        pyg = (pygments_lexer(lexers, lexer)
+               if lexer else
+               lexers.guess_lexer(text))
+        formatter = pygments_formatter(formatters, settings)
+        code = pygments.highlight(text, pyg, formatter)
+        code = code.replace('\n\n', '\n&nbsp;\n').replace('\n', '<br />')
+        caption = filename if filename else pyg.name
+        if not use_figure:
+            return code
+        return ('<div class="codebox"><figure class="code">%s<figcaption>'
+                '%s</figcaption></figure></div>\n\n'
+                % (code, caption))
+
+    cache = getattr(env, 'render_cache', None)
+    if cache is None:
+        return Markup(highlight(value))
+    return Markup(cache.render(
+        'syntax', [pygments.__version__, lexer, filename, settings,
+                   use_figure], value, highlight))
 
 
 class Spaceless(Extension):
@@ -482,6 +547,59 @@ class IncludeText(Extension):
             output = typo(output)
         return output
 
+
+class Cache(Extension):
+
+    """
+    Renders a fragment once for every distinct set of keys and reuses it.
+    The keys can be any expressions. Resources and nodes are identified by
+    their relative paths::
+
+        {% cache 'recent', resource.node %}
+            ...
+        {% endcache %}
+
+    Fragments are kept for the duration of a generation and, when the
+    `fragment_cache` setting names a folder, between generations. Stored
+    fragments are used while the templates they use, the resources and
+    nodes in their keys and the resources and folders they read are
+    unchanged.
+    """
+
+    tags = set(['cache'])
+
+    def parse(self, parser):
+        """
+        Parses the keys and the body of the fragment.
+        """
+        lineno = next(parser.stream).lineno
+        keys = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            keys.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        references = sorted(set(
+            ref for ref in find_referenced_templates(nodes.Template(body))
+            if ref))
+        return nodes.CallBlock(
+            self.call_method('_render_cache',
+                             args=[nodes.Const(parser.name),
+                                   nodes.Const(lineno),
+                                   nodes.Const(references),
+                                   nodes.List(keys)]),
+            [], [], body).set_lineno(lineno)
+
+    def _render_cache(self, name, lineno, references, keys, caller=None):
+        """
+        Returns the cached fragment or renders it.
+        """
+        if not caller:
+            return ''
+        cache = getattr(self.environment, 'fragment_cache', None)
+        if cache is None:
+            return caller()
+        return cache.render(name, lineno, references, keys, caller)
+
+
 MARKINGS = '_markings_'
 
 
@@ -576,7 +694,8 @@ class Refer(Extension):
                 self.call_method('_assign_reference',
                                  args=[
                                      nodes.Name(MARKINGS, 'load'),
-                                     nodes.Name(namespace, 'load')]),
+                                     nodes.Name(namespace, 'load'),
+                                     template]),
                 [], [], [includeNode]).set_lineno(lineno),
             nodes.Assign(nodes.Name('resource', 'store'),
                          nodes.Getitem(nodes.Name(namespace, 'load'),
@@ -601,13 +720,17 @@ class Refer(Extension):
             template)
         return ''
 
-    def _assign_reference(self, markings, namespace, caller):
+    def _assign_reference(self, markings, namespace, template, caller):
         """
         Assign the processed variables into the
-        given namespace.
+        given namespace. The referred template is rendered only if
+        its markings are not cached.
         """
-
-        out = caller()
+        cache = getattr(self.environment, 'reference_cache', None)
+        if cache:
+            (markings, out) = cache.render(template, markings, caller)
+        else:
+            out = caller()
         for key, value in markings.items():
             namespace[key] = value
         namespace['html'] = HtmlWrap(out)
@@ -644,11 +767,19 @@ class HydeLoader(FileSystemLoader):
         #
         template = template.replace(os.sep, '/')
         logger.debug("Loading template [%s] and preprocessing" % template)
+        content = getattr(self.site, 'content', None)
+        resource = content.resource_from_relative_path(template) \
+            if content else None
         try:
-            (contents,
-                filename,
-             date) = super(HydeLoader, self).get_source(
-                environment, template)
+            if resource:
+                (contents,
+                    filename,
+                 date) = self.get_resource_source(resource)
+            else:
+                (contents,
+                    filename,
+                 date) = super(HydeLoader, self).get_source(
+                    environment, template)
         except UnicodeDecodeError:
             HydeException.reraise(
                 "Unicode error when processing %s" % template, sys.exc_info())
@@ -658,12 +789,438 @@ class HydeLoader(FileSystemLoader):
                 str(exc)
             ), sys.exc_info())
 
-        if self.preprocessor:
-            resource = self.site.content.resource_from_relative_path(template)
-            if resource:
-                contents = self.preprocessor(resource, contents) or contents
+        if self.preprocessor and resource:
+            contents = self.preprocessor(resource, contents) or contents
         return (contents, filename, date)
 
+    def get_resource_source(self, resource):
+        """
+        Gets the source of a content resource from the source cache
+        of the site instead of reading the file again.
+        """
+        filename = resource.path
+        mtime = os.path.getmtime(filename)
+        contents = resource.read_source()
+
+        def uptodate():
+            try:
+                return os.path.getmtime(filename) == mtime
+            except OSError:
+                return False
+        return (contents, filename, uptodate)
+
+
+class HydeBytecodeCache(FileSystemBytecodeCache):
+
+    """
+    Keeps the compiled templates of a site between builds. Every template
+    is stored under the hash of its name and a `salt` that identifies the
+    versions of Jinja, hyde and Python and the settings of the environment.
+    The checksum is the hash of its source after the plugins have
+    preprocessed it, so a changed template is compiled again and replaces
+    its previous entry.
+    """
+
+    def __init__(self, directory, salt):
+        super(HydeBytecodeCache, self).__init__(directory, '%s.cache')
+        self.salt = salt
+        self.hits = 0
+        self.misses = 0
+
+    def get_bucket(self, environment, name, filename, source):
+        key = hashlib.sha1('\0'.join(
+            (self.salt, name or '')).encode('utf-8')).hexdigest()
+        checksum = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        bucket = Bucket(environment, key, checksum)
+        self.load_bytecode(bucket)
+        if bucket.code is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return bucket
+
+    def load_bytecode(self, bucket):
+        try:
+            super(HydeBytecodeCache, self).load_bytecode(bucket)
+        except Exception:
+            logger.debug("Ignoring damaged bytecode for [%s]" % bucket.key)
+            bucket.reset()
+
+    def dump_bytecode(self, bucket):
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory):
+                raise
+        write_atomically(self._get_cache_filename(bucket),
+                         bucket.bytecode_to_string())
+
+
+class RenderCache(object):
+
+    """
+    Keeps the output of the markdown and syntax filters. Every output is
+    stored under the hash of the kind of transformation, its settings, the
+    input text and the version of hyde. The least recently used entries
+    are evicted when the total length of the kept text goes beyond
+    `max_size`. If a `directory` is given, outputs are also written to it
+    and used in later builds.
+    """
+
+    def __init__(self, max_size, directory=None):
+        super(RenderCache, self).__init__()
+        self.max_size = max_size
+        self.directory = directory
+        self.size = 0
+        self.entries = OrderedDict()
+        self.stats = {}
+
+    def clear(self):
+        """
+        Resets the counters. The entries are kept since they are never
+        stale.
+        """
+        self.stats = {}
+
+    def render(self, kind, settings, text, function):
+        """
+        Returns the output of `function` for the given text, calling it
+        only if the output is not cached.
+        """
+        text = str(text)
+        key = hashlib.sha1('\0'.join((
+            json.dumps([__version__, kind, settings], default=repr,
+                       sort_keys=True),
+            text)).encode('utf-8')).hexdigest()
+        stats = self.stats.setdefault(kind, [0, 0])
+        output = self.entries.pop(key, None)
+        if output is not None:
+            self.size -= len(output)
+        elif self.directory:
+            output = self.load(key)
+        if output is None:
+            stats[1] += 1
+            output = str(function(text))
+            if self.directory:
+                self.save(key, output)
+        else:
+            stats[0] += 1
+        self.keep(key, output)
+        return output
+
+    def keep(self, key, output):
+        if len(output) > self.max_size:
+            return
+        self.entries[key] = output
+        self.size += len(output)
+        while self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def load(self, key):
+        try:
+            with open(os.path.join(self.directory, key), 'rb') as stream:
+                return stream.read().decode('utf-8')
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save(self, key, output):
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory):
+                raise
+        write_atomically(os.path.join(self.directory, key),
+                         output.encode('utf-8'))
+
+
+def file_stamps(paths):
+    """
+    Returns the modification times and sizes of the files at the given
+    paths. Missing files are mapped to None.
+    """
+    stamps = {}
+    for path in paths:
+        if path:
+            try:
+                stat = os.stat(path)
+                stamps[path] = [stat.st_mtime, stat.st_size]
+            except OSError:
+                stamps[path] = None
+    return stamps
+
+
+class ReadTracker(object):
+
+    """
+    Records the templates, resources and content folders that are read
+    while a fragment renders. The lookups of the environment are wrapped
+    only while the outermost fragment renders. Nested fragments pass their
+    reads on to the fragment that contains them.
+    """
+
+    def __init__(self, env):
+        super(ReadTracker, self).__init__()
+        self.env = env
+        self.reads = None
+
+    def capture(self, caller):
+        """
+        Calls `caller` and returns the text along with the paths of the
+        files it reads.
+        """
+        outer = self.reads
+        self.reads = set()
+        env = self.env
+        if outer is None:
+            env.getattr = self.tracking(env.getattr)
+            env.getitem = self.tracking(env.getitem)
+            env.get_template = self.tracking_templates(env.get_template)
+        try:
+            text = caller()
+            reads = self.reads
+        finally:
+            self.reads = outer
+            if outer is None:
+                del env.getattr, env.getitem, env.get_template
+        paths = set()
+        for value in reads:
+            if isinstance(value, Resource):
+                paths.add(value.path)
+            elif isinstance(value, Node):
+                paths.update(node.path for node in value.walk())
+            else:
+                paths.add(value)
+        self.add(paths)
+        return text, paths
+
+    def add(self, paths):
+        """
+        Adds the given paths to the reads of the fragment being rendered,
+        if any.
+        """
+        if self.reads is not None:
+            self.reads.update(paths)
+
+    def tracking(self, lookup):
+        def tracked(obj, argument):
+            if isinstance(obj, (Node, Resource)):
+                self.reads.add(obj)
+            return lookup(obj, argument)
+        return tracked
+
+    def tracking_templates(self, get_template):
+        def tracked(*args, **kwargs):
+            template = get_template(*args, **kwargs)
+            if template.filename:
+                self.reads.add(template.filename)
+            return template
+        return tracked
+
+
+class FragmentCache(object):
+
+    """
+    Keeps the fragments rendered by the `cache` tag. Every fragment is
+    stored under the hash of the template name, the line of the tag, its
+    keys and `salt`, which identifies the configuration and the version of
+    hyde.
+
+    If a `directory` is given, fragments are also written to it along with
+    the modification times and sizes of their dependencies: the template
+    that contains the tag, the templates referenced inside the fragment,
+    the resources and nodes used as keys, and every template, resource and
+    content folder read while the fragment was rendered. A stored fragment
+    is used when none of them has changed.
+    """
+
+    def __init__(self, template, directory=None, salt=''):
+        super(FragmentCache, self).__init__()
+        self.template = template
+        self.directory = directory
+        self.salt = salt
+        self.fragments = {}
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self, salt=None):
+        """
+        Forgets the fragments kept in memory and resets the counters.
+        """
+        if salt is not None:
+            self.salt = salt
+        self.fragments = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_part(value):
+        if isinstance(value, (Node, Resource)):
+            return '%s:%s' % (value.__class__.__name__, value.relative_path)
+        return repr(value)
+
+    def render(self, name, lineno, references, keys, caller):
+        """
+        Returns the fragment for the given keys, calling `caller` to
+        render it if it is not cached.
+        """
+        key = hashlib.sha1(json.dumps(
+            [self.salt, name, lineno] + [self.key_part(value)
+                                         for value in keys]
+        ).encode('utf-8')).hexdigest()
+        entry = self.fragments.get(key)
+        deps = None
+        if entry is None and self.directory and name:
+            deps = self.dependencies(name, references, keys)
+            entry = self.load(key, deps)
+        tracker = self.template.env.read_tracker
+        if entry is None:
+            self.misses += 1
+            text, reads = tracker.capture(caller)
+            if deps is not None:
+                deps.update(file_stamps(reads.difference(deps)))
+                self.save(key, deps, text)
+                reads.update(deps)
+            entry = (text, reads)
+        else:
+            self.hits += 1
+        tracker.add(entry[1])
+        self.fragments[key] = entry
+        return entry[0]
+
+    def dependencies(self, name, references, keys):
+        """
+        Returns the modification times and sizes of the files that the
+        fragment depends on.
+        """
+        templates = set([name])
+        for reference in references:
+            templates.add(reference)
+            templates.update(self.template.get_dependencies(reference))
+        paths = set(self.template.template_path(template)
+                    for template in templates if template)
+        for value in keys:
+            if isinstance(value, Node):
+                paths.update(resource.path
+                             for resource in value.walk_resources())
+            elif isinstance(value, Resource):
+                paths.add(value.path)
+        return file_stamps(paths)
+
+    def load(self, key, deps):
+        path = os.path.join(self.directory, key + '.json')
+        try:
+            with open(path, 'rb') as stream:
+                data = json.loads(stream.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return None
+        stored = data.get('deps') or {}
+        if any(stored.get(path) != stamp for path, stamp in deps.items()):
+            return None
+        reads = [path for path in stored if path not in deps]
+        if file_stamps(reads) != dict((path, stored[path]) for path in reads):
+            return None
+        return data.get('text'), set(stored)
+
+    def save(self, key, deps, text):
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory):
+                raise
+        data = json.dumps(dict(deps=deps, text=str(text)))
+        write_atomically(os.path.join(self.directory, key + '.json'),
+                         data.encode('utf-8'))
+
+
+class ReferenceCache(object):
+
+    """
+    Keeps the markings and the html of the templates referred to by the
+    `refer` tag, so that every referred template is rendered once. An
+    entry is checked against the modification times and sizes of the
+    templates and resources read while it was rendered, the first time it
+    is used in a generation. The least recently used entries are evicted
+    when the total length of the kept text goes beyond `max_size`.
+    """
+
+    def __init__(self, template, max_size):
+        super(ReferenceCache, self).__init__()
+        self.template = template
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.checked = set()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """
+        Resets the counters and checks every entry again when it is next
+        used.
+        """
+        self.checked = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name):
+        """
+        Returns the markings and the html of the given template or None
+        if they have to be rendered.
+        """
+        entry = self.entries.pop(name, None)
+        if entry:
+            self.size -= entry[3]
+            if name not in self.checked:
+                self.checked.add(name)
+                if entry[0] != file_stamps(entry[0]):
+                    entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries[name] = entry
+        self.size += entry[3]
+        self.template.env.read_tracker.add(entry[0])
+        return entry[1:3]
+
+    def render(self, name, markings, caller):
+        """
+        Returns the markings and the html of the given template, calling
+        `caller` to render them into `markings` if they are not kept.
+        """
+        cached = self.get(name)
+        if cached:
+            return cached
+        html, reads = self.template.env.read_tracker.capture(caller)
+        self.set(name, markings, html, reads)
+        return markings, html
+
+    def set(self, name, markings, html, reads):
+        """
+        Keeps the markings and the html rendered for the given template,
+        along with the paths of the files read to render them.
+        """
+        self.discard(name)
+        self.checked.add(name)
+        size = len(html) + sum(len(str(value))
+                               for value in markings.values())
+        if size > self.max_size:
+            return
+        self.entries[name] = (file_stamps(reads), dict(markings), html, size)
+        self.size += size
+        while self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted[3]
+
+    def discard(self, name):
+        """
+        Forgets the markings and the html of the given template.
+        """
+        entry = self.entries.pop(name, None)
+        if entry:
+            self.size -= entry[3]
+
 
 # pylint: disable-msg=W0104,E0602,W0613,R0201
 class Jinja2Template(Template):
@@ -681,6 +1238,8 @@ class Jinja2Template(Template):
         """
         self.site = site
         self.engine = engine
+        self.dependency_cache = {}
+        self.checked_references = set()
         self.preprocessor = (engine.preprocessor
                              if hasattr(engine, 'preprocessor') else None)
 
@@ -696,6 +1255,7 @@ class Jinja2Template(Template):
             Reference,
             Refer,
             YamlVar,
+            Cache,
             'jinja2.ext.do',
             'jinja2.ext.loopcontrols',
             'jinja2.ext.with_'
@@ -752,8 +1312,8 @@ class Jinja2Template(Template):
             undefined=SilentUndefined,
             line_statement_prefix=settings['line_statement_prefix'],
             trim_blocks=True,
-            bytecode_cache=FileSystemBytecodeCache(),
             extensions=settings['extensions'])
+        self.env.bytecode_cache = self.create_bytecode_cache(site, conf)
         self.env.globals['media_url'] = media_url
         self.env.globals['content_url'] = content_url
         self.env.globals['full_url'] = full_url
@@ -777,6 +1337,15 @@ class Jinja2Template(Template):
             config = site.config
 
         self.env.extend(config=config)
+        self.env.extend(read_tracker=ReadTracker(self.env))
+        folder = getattr(config, 'fragment_cache', None)
+        self.env.extend(fragment_cache=FragmentCache(
+            self, os.path.join(str(self.sitepath), str(folder))
+            if folder else None, self.fragment_salt()))
+        self.env.extend(render_cache=self.create_render_cache(config))
+        self.env.extend(reference_cache=ReferenceCache(
+            self, int(getattr(config, 'render_cache_size', 16) * 1024 * 1024))
+            if getattr(config, 'refer_cache', False) else None)
 
         try:
             from typogrify.templatetags import jinja_filters
@@ -786,34 +1355,159 @@ class Jinja2Template(Template):
         if jinja_filters:
             jinja_filters.register(self.env)
 
+    def create_bytecode_cache(self, site, conf):
+        """
+        Creates the bytecode cache in the folder given by the
+        `bytecode_cache` setting, relative to the site path. Returns None
+        if the setting is empty.
+        """
+        folder = getattr(getattr(site, 'config', None), 'bytecode_cache',
+                         None)
+        if not folder:
+            return None
+        salt = json.dumps(dict(
+            jinja2=jinja2.__version__,
+            hyde=__version__,
+            python=list(sys.version_info[:2]),
+            extensions=sorted(self.env.extensions),
+            line_statement_prefix=self.env.line_statement_prefix,
+            trim_blocks=self.env.trim_blocks,
+            settings=conf), default=repr, sort_keys=True)
+        directory = os.path.join(str(self.sitepath), str(folder))
+        return HydeBytecodeCache(directory, salt)
+
+    def create_render_cache(self, config):
+        """
+        Creates the cache for the output of the markdown and syntax
+        filters. Outputs are also kept between builds in the folder given
+        by the `render_cache` setting, relative to the site path.
+        """
+        size = getattr(config, 'render_cache_size', 16)
+        folder = getattr(config, 'render_cache', None)
+        return RenderCache(
+            int(size * 1024 * 1024),
+            os.path.join(str(self.sitepath), str(folder)) if folder else None)
+
     def clear_caches(self):
         """
-        Clear all caches to prepare for regeneration
+        Clear all caches to prepare for regeneration. The bytecode cache
+        is kept since its entries are never stale. Only its counters are
+        reset.
+        """
+        cache = self.env.bytecode_cache
+        if isinstance(cache, HydeBytecodeCache):
+            cache.hits = cache.misses = 0
+        self.env.fragment_cache.clear(self.fragment_salt())
+        self.env.render_cache.clear()
+        if self.env.reference_cache:
+            self.env.reference_cache.clear()
+        self.checked_references = set()
+
+    def fragment_salt(self):
+        """
+        Identifies the configuration and the version of hyde that the
+        cached fragments were rendered with.
         """
-        if self.env.bytecode_cache:
-            self.env.bytecode_cache.clear()
+        config = {}
+        if hasattr(self.site, 'config'):
+            config = self.site.config.to_dict()
+            for key in ('load_time', 'config_files'):
+                config.pop(key, None)
+        return json.dumps(dict(config=config, hyde=__version__),
+                          default=repr, sort_keys=True)
+
+    def cache_stats(self):
+        """
+        Returns the number of hits and misses of the bytecode cache, the
+        fragment cache, the outputs of the markdown and syntax filters and
+        the referred templates.
+        """
+        stats = {}
+        cache = self.env.bytecode_cache
+        if isinstance(cache, HydeBytecodeCache):
+            stats['bytecode'] = (cache.hits, cache.misses)
+        fragments = self.env.fragment_cache
+        if fragments.hits or fragments.misses:
+            stats['fragment'] = (fragments.hits, fragments.misses)
+        for kind, (hits, misses) in self.env.render_cache.stats.items():
+            stats[kind] = (hits, misses)
+        references = self.env.reference_cache
+        if references and (references.hits or references.misses):
+            stats['refer'] = (references.hits, references.misses)
+        return stats
+
+    def release_resource(self, resource):
+        """
+        Drops the cached references and the cached markings of the given
+        resource.
+        """
+        self.dependency_cache.pop(resource.relative_path, None)
+        self.checked_references.discard(resource.relative_path)
+        if self.env.reference_cache:
+            self.env.reference_cache.discard(resource.relative_path)
+
+    def get_references(self, path):
+        """
+        Returns the templates referenced directly by the template at the
+        given path. The references are cached along with the hash of the
+        source, so a template is parsed again only when it changes. Layouts
+        are not even read again as long as they are not modified. A cached
+        entry is checked once per generation.
+        """
+        entry = self.dependency_cache.get(path)
+        if entry and path in self.checked_references:
+            return entry[2]
+        self.checked_references.add(path)
+        if entry and entry[0] and entry[0]():
+            return entry[2]
+        text, _, uptodate = self.env.loader.get_source(self.env, path)
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        if entry and entry[1] == digest:
+            references = entry[2]
+        else:
+            from jinja2.meta import find_referenced_templates
+            try:
+                ast = self.env.parse(text)
+            except Exception as e:
+                HydeException.reraise(
+                    "Error processing %s: \n%s" % (path, str(e)),
+                    sys.exc_info())
+            references = list(find_referenced_templates(ast))
+        # The source of content resources is preprocessed by the plugins.
+        # Its modification time alone does not tell if it has changed.
+        content = getattr(self.site, 'content', None)
+        if content and content.resource_from_relative_path(path):
+            uptodate = None
+        self.dependency_cache[path] = (uptodate, digest, references)
+        return references
+
+    def template_path(self, template):
+        """
+        Returns the path of the file the loader reads the given template
+        from, or None if it is not found.
+        """
+        for folder in self.loader.searchpath:
+            path = os.path.join(folder, *template.split('/'))
+            if os.path.isfile(path):
+                return path
+        return None
 
     def get_dependencies(self, path):
         """
         Finds dependencies hierarchically based on the included
-        files.
-        """
-        text = self.env.loader.get_source(self.env, path)[0]
-        from jinja2.meta import find_referenced_templates
-        try:
-            ast = self.env.parse(text)
-        except Exception as e:
-            HydeException.reraise(
-                "Error processing %s: \n%s" % (path, str(e)),
-                sys.exc_info())
-
-        tpls = find_referenced_templates(ast)
-        deps = list(self.env.globals['deps'].get('path', []))
-        for dep in tpls:
-            deps.append(dep)
-            if dep:
-                deps.extend(self.get_dependencies(dep))
-        return list(set(deps))
+        files. Every template is visited once, even if it is included
+        more than once or the includes form a cycle.
+        """
+        deps = set(self.env.globals['deps'].get('path', []))
+        seen = set([path])
+        pending = [path]
+        while pending:
+            for dep in self.get_references(pending.pop()):
+                deps.add(dep)
+                if dep and dep not in seen:
+                    seen.add(dep)
+                    pending.append(dep)
+        return list(deps)
 
     @property
     def exception_class(self):
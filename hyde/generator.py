@@ -4,37 +4,96 @@ The generator class and related utility functions.
 """
 
 from commando.util import getLoggerWithNullHandler
-from fswrap import File, Folder
+from fswrap import File
+from hyde._compat import str
 from hyde.exceptions import HydeException
-from hyde.model import Context, Dependents
+from hyde.model import Context, Dependents, Manifest
 from hyde.plugin import Plugin
 from hyde.template import Template
 from hyde.site import Resource
+from hyde.util import (file_digest, has_contents, peak_memory,
+                       same_file_contents)
+from hyde.version import __version__
 
 from contextlib import contextmanager
 from datetime import datetime
+import hashlib
+import json
+import multiprocessing
+import os
 from shutil import copymode
 import sys
 
 logger = getLoggerWithNullHandler('hyde.engine')
 
+# The generator whose resources are being generated by the worker
+# processes. Workers are forked after the site has been loaded and
+# the plugins have seen `begin_site`, so they inherit this state.
+_worker_generator = None
+
+
+def _fork_context():
+    """
+    Returns a multiprocessing context that forks worker processes or
+    None if forking is not supported on this platform.
+    """
+    try:
+        return multiprocessing.get_context('fork')
+    except AttributeError:
+        # Python 2: multiprocessing always forks on posix.
+        return multiprocessing if sys.platform != 'win32' else None
+    except ValueError:
+        return None
+
+
+@contextmanager
+def _untimed():
+    yield
+
+
+def _generate_resource_in_worker(args):
+    """
+    Generates the resource at the given index in a worker process and
+    returns the state that needs to be merged back into the parent.
+    """
+    index, incremental = args
+    generator = _worker_generator
+    resource = generator.worker_resources[index]
+    if resource.node not in generator.worker_nodes:
+        # The worker was forked before the parent raised `begin_node`.
+        generator.worker_nodes.add(resource.node)
+        generator.events.begin_node(resource.node)
+    generator.stats = dict.fromkeys(generator.stats, 0)
+    if generator.profiler:
+        generator.profiler.reset()
+    generator.__generate_resource__(resource, incremental)
+    return generator.__resource_state__(resource)
+
 
 class Generator(object):
     """
     Generates output from a node or resource.
     """
 
-    def __init__(self, site):
+    def __init__(self, site, jobs=1, profiler=None):
         super(Generator, self).__init__()
         self.site = site
+        self.jobs = jobs if jobs > 0 else multiprocessing.cpu_count()
+        self.profiler = profiler
+        self.worker_resources = []
+        self.worker_nodes = set()
         self.generated_once = False
         self.deps = Dependents(site.sitepath)
+        self.manifest = Manifest(site.config.deploy_root_path)
+        self.digests = {}
+        self.config_digest = None
+        self.stats = dict(generated=0, skipped=0, written=0)
         self.waiting_deps = {}
         self.create_context()
         self.template = None
         Plugin.load_all(site)
 
-        self.events = Plugin.get_proxy(self.site)
+        self.events = Plugin.get_proxy(self.site, profiler)
 
     def create_context(self):
         site = self.site
@@ -103,6 +162,11 @@ class Generator(object):
         Start Generation. Perform setup tasks and inform plugins.
         """
         logger.debug("Begin Generation")
+        self.digests = {}
+        self.config_digest = None
+        self.stats = dict(generated=0, skipped=0, written=0)
+        if self.template:
+            self.template.clear_caches()
         self.events.begin_generation()
 
     def load_site_if_needed(self):
@@ -118,6 +182,22 @@ class Generator(object):
         """
         logger.debug("Generation Complete")
         self.events.generation_complete()
+        self.deps.save()
+        self.manifest.save()
+        snapshot = getattr(self.site, 'snapshot', None)
+        if snapshot:
+            snapshot.save()
+        logger.info("Generated %(generated)d resources. "
+                    "Skipped %(skipped)d unchanged resources. "
+                    "Wrote %(written)d files." % self.stats)
+        if self.template:
+            for name, (hits, misses) in sorted(
+                    self.template.cache_stats().items()):
+                logger.info("Template %s cache: %d hits, %d misses" %
+                            (name, hits, misses))
+        peak = peak_memory()
+        if peak:
+            logger.info("Peak memory usage: %.1f MB" % (peak / 1048576.0))
 
     def get_dependencies(self, resource):
         """
@@ -159,6 +239,56 @@ class Generator(object):
             self.deps[path].extend(deps)
         return deps
 
+    def get_digest(self, path):
+        """
+        Gets the content hash of the file at the given path. The hashes
+        are remembered for the current generation as long as the file
+        stays untouched.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (stat.st_mtime, stat.st_size)
+        cached = self.digests.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        digest = file_digest(path)
+        self.digests[path] = (key, digest)
+        return digest
+
+    def get_dependency_digest(self, dep):
+        """
+        Gets the content hash of a dependency. Dependencies are looked up
+        in the content folder first and then in the layout folder.
+        """
+        source = File(self.site.content.source_folder.child(dep))
+        if not source.exists:
+            source = File(self.site.config.layout_root_path.child(dep))
+        return self.get_digest(source.path)
+
+    def get_config_digest(self):
+        """
+        Gets a hash of everything outside the resources that affects the
+        generated output: the configuration, the context data, the
+        plugins in use and the version of hyde.
+        """
+        if not self.config_digest:
+            config = self.site.config.to_dict()
+            for key in ('load_time', 'config_files'):
+                config.pop(key, None)
+            plugins = ['%s.%s' % (plugin.__class__.__module__,
+                                  plugin.__class__.__name__)
+                       for plugin in self.site.plugins]
+            data = json.dumps(dict(config=config,
+                                   context=self.site.context,
+                                   plugins=plugins,
+                                   version=__version__),
+                              default=repr, sort_keys=True)
+            self.config_digest = hashlib.sha1(
+                data.encode('utf-8')).hexdigest()
+        return self.config_digest
+
     def has_resource_changed(self, resource):
         """
         Checks if the given resource has changed since the
@@ -168,46 +298,155 @@ class Generator(object):
         self.load_template_if_needed()
         self.load_site_if_needed()
 
-        target = File(self.site.config.deploy_root_path.child(
-                      resource.relative_deploy_path))
-        if not target.exists or target.older_than(resource.source_file):
+        target_path = str(resource.relative_deploy_path)
+        target = File(self.site.config.deploy_root_path.child(target_path))
+        entry = self.manifest.get(target_path)
+        if not target.exists or not entry or \
+                entry['path'] != resource.relative_path:
             logger.debug("Found changes in %s" % resource)
             return True
-        if resource.source_file.is_binary:
-            logger.debug("No Changes found in %s" % resource)
-            return False
-        if self.site.config.needs_refresh() or \
-           not target.has_changed_since(self.site.config.last_modified):
+        if entry['config'] != self.get_config_digest():
             logger.debug("Site configuration changed")
             return True
+        if entry['source'] != self.get_digest(resource.path):
+            logger.debug("Found changes in %s" % resource)
+            return True
 
-        deps = self.get_dependencies(resource)
-        if not deps or None in deps:
-            logger.debug("No changes found in %s" % resource)
-            return False
-        content = self.site.content.source_folder
-        layout = Folder(self.site.sitepath).child_folder('layout')
-        logger.debug("Checking for changes in dependents:%s" % deps)
-        for dep in deps:
-            if not dep:
-                return True
-            source = File(content.child(dep))
-            if not source.exists:
-                source = File(layout.child(dep))
-            if not source.exists:
-                return True
-            if target.older_than(source):
+        deps = entry['deps']
+        logger.debug("Checking for changes in dependents:%s" % list(deps))
+        for dep, digest in deps.items():
+            if self.get_dependency_digest(dep) != digest:
+                logger.debug("Found changes in dependency %s" % dep)
                 return True
         logger.debug("No changes found in %s" % resource)
         return False
 
+    def record_resource(self, resource, source_digest, deps):
+        """
+        Records the inputs of a generated resource in the build manifest.
+        """
+        self.manifest.record(
+            str(resource.relative_deploy_path),
+            resource.relative_path,
+            source_digest,
+            dict((dep, self.get_dependency_digest(dep)) for dep in deps),
+            self.get_config_digest())
+        self.stats['generated'] += 1
+
+    def get_dependency_name(self, path):
+        """
+        Converts the given path to the name used for it in the dependency
+        graph: the path relative to the content folder or the layout
+        folder, with forward slashes.
+        """
+        afile = File(path)
+        for root in (self.site.content.source_folder,
+                     self.site.config.layout_root_path):
+            if afile.is_descendant_of(root):
+                path = afile.get_relative_path(root)
+                break
+        return str(path).replace(os.sep, '/')
+
+    def affected_by(self, paths):
+        """
+        Returns the set of resources that have to be regenerated when the
+        files at the given paths change: the resources at those paths and
+        the resources that depend on them. Relative paths are resolved
+        against the content folder first and then the layout folder.
+        A change to a configuration file affects every resource.
+        """
+        self.load_site_if_needed()
+        content = self.site.content
+        config_files = set(str(conf) for conf in self.site.config.config_files)
+        names = set()
+        resources = set()
+        for path in paths:
+            if str(File(path)) in config_files:
+                return set(content.walk_resources())
+            name = self.get_dependency_name(path)
+            names.add(name)
+            resource = content.resource_from_relative_path(name)
+            if resource:
+                resources.add(resource)
+        for rel_path in self.deps.dependents_of(names):
+            resource = content.resource_from_relative_path(rel_path)
+            if resource:
+                resources.add(resource)
+        return resources
+
+    def generate_affected(self, paths):
+        """
+        Regenerates the resources affected by changes to the files at the
+        given paths. See `affected_by`.
+        """
+        self.load_template_if_needed()
+        self.initialize()
+        resources = self.affected_by(paths)
+        logger.info("Regenerating %d affected resources" % len(resources))
+        try:
+            with self.events_for(self.site.content):
+                for resource in sorted(resources):
+                    self.__generate_resource__(resource)
+            self.finalize()
+        except HydeException:
+            self.generate_all()
+
+    def apply_changes(self, created=(), deleted=(), modified=()):
+        """
+        Updates the loaded site with the files and folders that have been
+        created or deleted in the content folder, without reloading it.
+        The outputs of the removed resources are deleted. The added
+        resources and the resources affected by any of the created,
+        deleted or modified paths are generated. Returns a tuple
+        containing the lists of added and removed resources.
+
+        The indexes that plugins build in `begin_site`, such as tags,
+        sorters and groups, are not rebuilt, and the pages that list the
+        content are not regenerated. Adding or removing content needs a
+        full generation for those.
+        """
+        self.load_template_if_needed()
+        self.load_site_if_needed()
+        added, removed = self.site.content.apply_changes(created, deleted)
+        for resource in removed:
+            self.events.resource_removed(resource)
+            self.delete_outputs(resource)
+            self.template.release_resource(resource)
+        for resource in added:
+            self.events.resource_added(resource)
+            self.template.release_resource(resource)
+        paths = set(created) | set(deleted) | set(modified)
+        paths.update(resource.path for resource in added)
+        self.generate_affected(paths)
+        return added, removed
+
+    def delete_outputs(self, resource):
+        """
+        Deletes the files generated from the given resource, unless
+        another resource is deployed to the same path now.
+        """
+        content = self.site.content
+        deploy = self.site.config.deploy_root_path
+        targets = set(self.manifest.discard(resource.relative_path))
+        targets.add(str(resource.relative_deploy_path))
+        for target in targets:
+            if target in content.resource_deploy_map or \
+                    content.resource_from_relative_path(target):
+                continue
+            output = File(deploy.child(target))
+            if output.exists:
+                logger.debug("Deleting stale output [%s]" % target)
+                output.delete()
+        rel_path = resource.relative_path
+        if rel_path in self.deps:
+            del self.deps[rel_path]
+
     def generate_all(self, incremental=False):
         """
         Generates the entire website
         """
         logger.info("Reading site contents")
         self.load_template_if_needed()
-        self.template.clear_caches()
         self.initialize()
         self.load_site_if_needed()
         self.events.begin_site()
@@ -303,15 +542,147 @@ class Generator(object):
             logger.debug("Refreshing configuration and context")
             self.site.refresh_config()
             self.create_context()
+            self.config_digest = None
 
     def __generate_node__(self, node, incremental=False):
         self.refresh_config()
+        if self.jobs > 1:
+            context = _fork_context()
+            unsafe = [plugin.plugin_name for plugin in self.site.plugins
+                      if not plugin.parallel_safe]
+            if unsafe:
+                logger.warning("The plugins [%s] cannot be used with "
+                               "parallel generation. Generating resources "
+                               "serially.", ', '.join(unsafe))
+            elif context:
+                return self.__generate_node_parallel__(
+                    node, context, incremental)
+            else:
+                logger.warning("Parallel generation is not supported on "
+                               "this platform. Generating resources "
+                               "serially.")
+        low_memory = self.site.config.low_memory
         for node in node.walk():
             logger.debug("Generating Node [%s]", node)
             self.events.begin_node(node)
-            for resource in sorted(node.resources):
+            for resource in list(node.resources):
                 self.__generate_resource__(resource, incremental)
+                if low_memory:
+                    self.release_resource(resource)
             self.events.node_complete(node)
+            if low_memory:
+                self.deps.release()
+
+    def release_resource(self, resource):
+        """
+        Drops what is kept in memory for the given resource once it has
+        been generated: its source text, the hash of its source and the
+        references cached by the template. They are read again if another
+        resource asks for them. The metadata is kept, since plugins may
+        have changed it in `begin_site`.
+        """
+        cache = getattr(self.site, 'source_cache', None)
+        if cache is not None:
+            cache.discard(resource.path)
+        self.digests.pop(resource.path, None)
+        self.waiting_deps.pop(resource.relative_path, None)
+        self.template.release_resource(resource)
+
+    def __generate_node_parallel__(self, node, context, incremental=False):
+        """
+        Generates the resources in the given node hierarchy using a pool
+        of worker processes. Node events are raised in this process, in
+        the same order as in serial generation: the resources of a node
+        are generated between its `begin_node` and `node_complete`.
+        """
+        global _worker_generator
+        nodes = list(node.walk())
+        resources = [resource for node in nodes for resource in node.resources]
+        logger.info("Generating %d resources using %d processes",
+                    len(resources), self.jobs)
+        _worker_generator = self
+        self.worker_resources = resources
+        self.worker_nodes = set()
+        pool = context.Pool(self.jobs)
+        try:
+            start = 0
+            for node in nodes:
+                logger.debug("Generating Node [%s]", node)
+                self.events.begin_node(node)
+                end = start + len(node.resources)
+                chunksize = max(1, (end - start) // (self.jobs * 4))
+                tasks = ((index, incremental)
+                         for index in range(start, end))
+                for state in pool.imap_unordered(
+                        _generate_resource_in_worker, tasks, chunksize):
+                    self.__merge_resource_state__(state)
+                start = end
+                self.events.node_complete(node)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _worker_generator = None
+            self.worker_resources = []
+
+    def __resource_state__(self, resource):
+        """
+        Returns the state collected while generating the given resource
+        in a worker process.
+        """
+        rel_path = resource.relative_path
+        target = str(resource.relative_deploy_path)
+        deps = self.deps[rel_path] if rel_path in self.deps else None
+        profile = self.profiler.get_state() if self.profiler else None
+        return dict(path=rel_path, deps=deps,
+                    target=target, manifest=self.manifest.get(target),
+                    stats=self.stats, profile=profile)
+
+    def __merge_resource_state__(self, state):
+        """
+        Merges the state returned by a worker process.
+        """
+        if state['deps'] is not None:
+            self.deps[state['path']] = state['deps']
+        if state['manifest'] is not None:
+            self.manifest.entries[state['target']] = \
+                self.manifest.share_entry(state['manifest'])
+        for key, value in state['stats'].items():
+            self.stats[key] += value
+        if state['profile']:
+            self.profiler.merge(state['profile'])
+
+    def write_resource(self, resource, target, text=None):
+        """
+        Writes the given text to the target or copies the source file of
+        the resource if there is no text. If `write_if_changed` is set in
+        the configuration, a target that has the same contents already
+        is left untouched.
+        """
+        if self.site.config.write_if_changed:
+            if text is None:
+                unchanged = same_file_contents(resource.path, target.path)
+            else:
+                unchanged = has_contents(target.path, text.encode('utf-8'))
+            if unchanged:
+                logger.debug("Output is unchanged [%s]", target)
+                return
+        if text is None:
+            resource.source_file.copy_to(target)
+        else:
+            target.write(text)
+            copymode(resource.source_file.path, target.path)
+        self.stats['written'] += 1
+
+    def timed(self, resource, step):
+        """
+        Times the given step in generating the resource when profiling.
+        """
+        if self.profiler:
+            return self.profiler.timed_resource(resource.relative_path, step)
+        return _untimed()
 
     def __generate_resource__(self, resource, incremental=False):
         self.refresh_config()
@@ -320,38 +691,45 @@ class Generator(object):
             return
         if incremental and not self.has_resource_changed(resource):
             logger.debug("No changes found. Skipping resource [%s]", resource)
+            self.stats['skipped'] += 1
             return
         logger.debug("Processing [%s]", resource)
+        source_digest = self.get_digest(resource.path)
+        deps = []
         with self.context_for_resource(resource) as context:
             target = File(self.site.config.deploy_root_path.child(
                           resource.relative_deploy_path))
             target.parent.make()
             if resource.simple_copy:
                 logger.debug("Simply Copying [%s]", resource)
-                resource.source_file.copy_to(target)
+                with self.timed(resource, 'copy'):
+                    self.write_resource(resource, target)
             elif resource.source_file.is_text:
-                self.update_deps(resource)
-                if resource.uses_template:
-                    logger.debug("Rendering [%s]", resource)
-                    try:
-                        text = self.template.render_resource(resource,
-                                                             context)
-                    except Exception as e:
-                        HydeException.reraise("Error occurred when processing"
-                                              "template: [%s]: %s" %
-                                              (resource, repr(e)),
-                                              sys.exc_info())
-                else:
-                    text = resource.source_file.read_all()
-                    text = self.events.begin_text_resource(
-                        resource, text) or text
+                with self.timed(resource, 'render'):
+                    deps = self.update_deps(resource)
+                    if resource.uses_template:
+                        logger.debug("Rendering [%s]", resource)
+                        try:
+                            text = self.template.render_resource(resource,
+                                                                 context)
+                        except Exception as e:
+                            HydeException.reraise(
+                                "Error occurred when processing"
+                                "template: [%s]: %s" % (resource, repr(e)),
+                                sys.exc_info())
+                    else:
+                        text = resource.read_source()
+                        text = self.events.begin_text_resource(
+                            resource, text) or text
 
-                text = self.events.text_resource_complete(
-                    resource, text) or text
-                target.write(text)
-                copymode(resource.source_file.path, target.path)
+                    text = self.events.text_resource_complete(
+                        resource, text) or text
+                with self.timed(resource, 'write'):
+                    self.write_resource(resource, target, text)
             else:
                 logger.debug("Copying binary file [%s]", resource)
                 self.events.begin_binary_resource(resource)
-                resource.source_file.copy_to(target)
+                with self.timed(resource, 'copy'):
+                    self.write_resource(resource, target)
                 self.events.binary_resource_complete(resource)
+        self.record_resource(resource, source_digest, deps)
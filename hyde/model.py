@@ -3,6 +3,10 @@
 Contains data structures and utilities for hyde.
 """
 import codecs
+import json
+import os
+import pickle
+import sqlite3
 import yaml
 from datetime import datetime
 
@@ -10,6 +14,7 @@ from commando.util import getLoggerWithNullHandler
 from fswrap import File, Folder
 
 from hyde._compat import iteritems, str, UserDict
+from hyde.util import file_digest, write_atomically
 
 logger = getLoggerWithNullHandler('hyde.engine')
 
@@ -133,23 +138,413 @@ class Dependents(UserDict):
 
     """
     Represents the dependency graph for hyde.
+
+    The graph is persisted in a sqlite database with one row per resource.
+    Entries are read on demand and only the entries that have changed are
+    written back when the graph is saved. The store also keeps an index
+    from every dependency to the resources that use it.
     """
 
     def __init__(self, sitepath, depends_file_name='.hyde_deps'):
         self.sitepath = Folder(sitepath)
-        self.deps_file = File(self.sitepath.child(depends_file_name))
-        self.data = {}
-        if self.deps_file.exists:
-            self.data = yaml.load(self.deps_file.read_all())
+        self.deps_file = File(self.sitepath.child(depends_file_name + '.db'))
+        self.legacy_deps_file = File(self.sitepath.child(depends_file_name))
+        self._data = None
+        self.cache = {}
+        self.stored = {}
+        self.removed = set()
+        self._connection = None
+        self._connection_pid = None
         import atexit
         atexit.register(self.save)
 
+    @property
+    def connection(self):
+        """
+        Lazily opens the database. A forked process gets its own
+        connection instead of sharing the one from its parent.
+        """
+        if self._connection_pid != os.getpid():
+            self._connection = None
+            self._connection_pid = os.getpid()
+            if self.deps_file.parent.exists:
+                try:
+                    self._connection = sqlite3.connect(self.deps_file.path)
+                    self._connection.executescript(
+                        'CREATE TABLE IF NOT EXISTS deps '
+                        '(resource TEXT PRIMARY KEY, deps TEXT NOT NULL);'
+                        'CREATE TABLE IF NOT EXISTS dependents '
+                        '(dep TEXT NOT NULL, resource TEXT NOT NULL);'
+                        'CREATE INDEX IF NOT EXISTS dependents_dep '
+                        'ON dependents (dep);'
+                        'CREATE INDEX IF NOT EXISTS dependents_resource '
+                        'ON dependents (resource);')
+                except sqlite3.Error as error:
+                    logger.warning("Cannot open the dependency store "
+                                   "[%s]: %s", self.deps_file, error)
+                    self._connection = None
+        return self._connection
+
+    def _stored_deps(self, key):
+        if key in self.removed or self.connection is None:
+            return None
+        row = self.connection.execute(
+            'SELECT deps FROM deps WHERE resource = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _cache_value(self, key, value):
+        self.cache[key] = value
+        self.stored[key] = list(value)
+        return value
+
+    def load(self):
+        """
+        Loads all the entries, including the ones from a dependency file
+        written by an older version of hyde. This is only needed when the
+        graph is iterated. Lookups by resource read a single entry.
+        """
+        if self._data is None:
+            if self.connection is not None:
+                for key, value in self.connection.execute(
+                        'SELECT resource, deps FROM deps'):
+                    if key not in self.cache and key not in self.removed:
+                        self._cache_value(key, json.loads(value))
+            if self.legacy_deps_file.exists:
+                legacy = yaml.load(self.legacy_deps_file.read_all()) or {}
+                for key, value in iteritems(legacy):
+                    if key not in self.cache and key not in self.removed:
+                        self.cache[key] = value
+            self._data = self.cache
+        return self._data
+
+    data = property(load)
+
+    def __getitem__(self, key):
+        if key in self.cache:
+            return self.cache[key]
+        if self._data is None:
+            value = self._stored_deps(key)
+            if value is not None:
+                return self._cache_value(key, value)
+            # Only a legacy dependency file has entries that are not in
+            # the database.
+            if not self.legacy_deps_file.exists:
+                raise KeyError(key)
+        return self.data[key]
+
+    def __contains__(self, key):
+        if key in self.cache:
+            return True
+        if self._data is None:
+            if self._stored_deps(key) is not None:
+                return True
+            if not self.legacy_deps_file.exists:
+                return False
+        return key in self.data
+
+    def __setitem__(self, key, value):
+        self.removed.discard(key)
+        self.cache[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.cache.pop(key, None)
+        self.removed.add(key)
+
+    def __len__(self):
+        return len(self.data)
+
+    def release(self, max_entries=1000):
+        """
+        Saves the changed entries and forgets the entries that have been
+        read, once there are at least `max_entries` of them. They are read
+        from the database again when needed. Nothing is forgotten when the
+        whole graph has been loaded or when there is no database.
+        """
+        if len(self.cache) < max_entries or self._data is not None or \
+                self.connection is None:
+            return
+        self.save()
+        if not self.removed:
+            self.cache = {}
+            self.stored = {}
+
+    def dependents_of(self, paths):
+        """
+        Returns the set of resources that depend on any of the given
+        paths. Uses the index in the database for the entries that have
+        not been read or changed in this process.
+        """
+        paths = set(paths)
+        found = set(key for key, value in iteritems(self.cache)
+                    if not paths.isdisjoint(value))
+        if self.connection is not None and paths:
+            query = ('SELECT DISTINCT resource FROM dependents '
+                     'WHERE dep IN (%s)' % ', '.join('?' * len(paths)))
+            for (key,) in self.connection.execute(query, list(paths)):
+                if key not in self.cache and key not in self.removed:
+                    found.add(key)
+        return found
+
+    def __iter__(self):
+        return iter(self.data)
+
     def save(self):
         """
-        Saves the dependency graph (just a dict for now).
+        Writes the changed entries to the database in a single transaction.
         """
-        if self.deps_file.parent.exists:
-            self.deps_file.write(yaml.dump(self.data))
+        if not self.deps_file.parent.exists or self.connection is None:
+            return
+        if self.legacy_deps_file.exists:
+            self.load()
+        changed = [(key, value) for key, value in iteritems(self.cache)
+                   if self.stored.get(key) != value]
+        removed = [(key,) for key in self.removed]
+        if changed or removed:
+            stale = removed + [(key,) for key, value in changed]
+            try:
+                with self.connection:
+                    self.connection.executemany(
+                        'INSERT OR REPLACE INTO deps (resource, deps) '
+                        'VALUES (?, ?)',
+                        [(key, json.dumps(value)) for key, value in changed])
+                    self.connection.executemany(
+                        'DELETE FROM deps WHERE resource = ?', removed)
+                    self.connection.executemany(
+                        'DELETE FROM dependents WHERE resource = ?', stale)
+                    self.connection.executemany(
+                        'INSERT INTO dependents (dep, resource) '
+                        'VALUES (?, ?)',
+                        [(dep, key) for key, value in changed
+                         for dep in set(value) if dep])
+            except sqlite3.Error as error:
+                logger.warning("Cannot save the dependency store "
+                               "[%s]: %s", self.deps_file, error)
+                return
+            for key, value in iteritems(self.cache):
+                self.stored[key] = list(value)
+            self.removed = set()
+        if self.legacy_deps_file.exists:
+            self.legacy_deps_file.delete()
+
+
+class Manifest(object):
+
+    """
+    Records the content hashes of the inputs that were used to generate
+    each resource in the deploy folder.
+
+    Every entry is keyed by the relative deploy path of the output and
+    contains the relative path of the resource, the hash of its source,
+    the hashes of its dependencies and the hash of the configuration.
+    Equal dependency maps and configuration hashes are kept once and
+    shared by the entries, since most pages extend the same layouts.
+    """
+
+    version = 1
+
+    def __init__(self, deploy_root, manifest_file_name='.hyde_manifest'):
+        self.manifest_file = File(Folder(deploy_root).child(
+            manifest_file_name))
+        self.entries = {}
+        self.shared = {}
+        if self.manifest_file.exists:
+            try:
+                data = json.loads(self.manifest_file.read_all(),
+                                  object_hook=self.share_entry)
+            except ValueError:
+                logger.warning("Ignoring invalid build manifest [%s]",
+                               self.manifest_file)
+                data = {}
+            if data.get('version') == self.version:
+                self.entries = data.get('outputs', {})
+            else:
+                self.shared = {}
+        import atexit
+        atexit.register(self.save)
+
+    def __contains__(self, target):
+        return target in self.entries
+
+    def get(self, target):
+        """
+        Returns the entry recorded for the given relative deploy path.
+        """
+        return self.entries.get(target)
+
+    def record(self, target, path, source, deps, config):
+        """
+        Records the inputs used to generate the output at the relative
+        deploy path `target` from the resource at the relative `path`.
+        """
+        self.entries[target] = self.share_entry(dict(
+            path=path, source=source, deps=deps, config=config))
+
+    def share(self, value):
+        """
+        Returns the kept string or dependency map that is equal to the
+        given one.
+        """
+        if isinstance(value, dict):
+            key = tuple(sorted(iteritems(value)))
+            shared = self.shared.get(key)
+            if shared is None:
+                shared = dict((self.share(dep), self.share(digest))
+                              for dep, digest in iteritems(value))
+                self.shared[key] = shared
+            return shared
+        return self.shared.setdefault(value, value)
+
+    def share_entry(self, entry):
+        """
+        Shares the values of the given entry with the other entries.
+        Other objects are returned unchanged.
+        """
+        if set(entry) != set(('path', 'source', 'deps', 'config')):
+            return entry
+        entry['deps'] = self.share(entry['deps'])
+        entry['config'] = self.share(entry['config'])
+        return entry
+
+    def discard(self, path):
+        """
+        Removes the entries of the outputs generated from the resource at
+        the relative `path`. Returns their relative deploy paths.
+        """
+        targets = [target for target, entry in iteritems(self.entries)
+                   if entry['path'] == path]
+        for target in targets:
+            del self.entries[target]
+        return targets
+
+    def save(self):
+        """
+        Writes the manifest to the deploy folder.
+        """
+        if not self.manifest_file.parent.exists:
+            return
+        data = dict(version=self.version, outputs=self.entries)
+        write_atomically(self.manifest_file.path,
+                         json.dumps(data, sort_keys=True).encode('utf-8'))
+
+
+class Snapshot(object):
+
+    """
+    Keeps the listings of the content folders and the values parsed from
+    the content files, like their metadata, between runs.
+
+    A folder listing is used while the modification time of the folder
+    is unchanged. The values parsed from a file are used while its
+    modification time and size are unchanged. When only the modification
+    time has changed, the values are still used if the hash of the file
+    is the same. The snapshot is discarded when its `key`, which is
+    derived from the configuration and the plugins, is different.
+    """
+
+    version = 1
+
+    def __init__(self, sitepath, key, snapshot_file_name='.hyde_snapshot'):
+        self.snapshot_file = File(Folder(sitepath).child(snapshot_file_name))
+        self.key = key
+        self.folders = {}
+        self.files = {}
+        self.seen = set()
+        self.dirty = False
+        if self.snapshot_file.exists:
+            try:
+                with open(self.snapshot_file.path, 'rb') as stream:
+                    data = pickle.load(stream)
+            except Exception as error:
+                logger.warning("Ignoring invalid site snapshot [%s]: %s",
+                               self.snapshot_file, error)
+                data = {}
+            if data.get('version') == self.version and \
+                    data.get('key') == key:
+                self.folders = data['folders']
+                self.files = data['files']
+            else:
+                logger.info("The configuration or the plugins have changed."
+                            " Loading the site without the snapshot.")
+
+    def listing(self, path, scan):
+        """
+        Returns the name, the path and whether it is a folder for the
+        entries in the folder at the given path. `scan(path)` is used
+        when the folder has changed since the snapshot.
+        """
+        self.seen.add(path)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        entry = self.folders.get(path)
+        if mtime is not None and entry and entry[0] == mtime:
+            return [(name, os.path.join(path, name), is_dir)
+                    for name, is_dir in entry[1]]
+        entries = list(scan(path))
+        if mtime is not None:
+            self.folders[path] = (mtime, [(name, is_dir)
+                                          for name, _, is_dir in entries])
+            self.dirty = True
+        return entries
+
+    def read(self, path, kind, parse):
+        """
+        Returns the value of the given kind for the file at the given
+        path. `parse(path)` computes the value when the file has changed
+        since the snapshot.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return parse(path)
+        entry = self.files.get(path)
+        if entry and entry[1] == stat.st_size:
+            if entry[0] != stat.st_mtime:
+                if entry[2] != file_digest(path):
+                    entry = None
+                else:
+                    entry = (stat.st_mtime,) + entry[1:]
+                    self.files[path] = entry
+                    self.dirty = True
+        else:
+            entry = None
+        if entry and kind in entry[3]:
+            return entry[3][kind]
+        value = parse(path)
+        if not entry:
+            entry = (stat.st_mtime, stat.st_size, file_digest(path), {})
+            self.files[path] = entry
+        entry[3][kind] = value
+        self.dirty = True
+        return value
+
+    def save(self):
+        """
+        Writes the snapshot to the site folder. Only the folders that
+        were listed in this run and their files are kept.
+        """
+        if not self.dirty or not self.snapshot_file.parent.exists:
+            return
+        folders = dict((path, self.folders[path]) for path in self.seen
+                       if path in self.folders)
+        names = set(os.path.join(path, name)
+                    for path, (_, entries) in iteritems(folders)
+                    for name, _ in entries)
+        files = dict((path, entry) for path, entry in iteritems(self.files)
+                     if path in names)
+        data = dict(version=self.version, key=self.key,
+                    folders=folders, files=files)
+        try:
+            write_atomically(self.snapshot_file.path,
+                             pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+        except (IOError, OSError, TypeError, pickle.PicklingError) as error:
+            logger.warning("Cannot save the site snapshot [%s]: %s",
+                           self.snapshot_file, error)
+            return
+        self.dirty = False
 
 
 def _expand_path(sitepath, path):
@@ -177,6 +572,16 @@ class Config(Expando):
             not_found='404.html',
             plugins=[],
             ignore=["*~", "*.bak", ".hg", ".git", ".svn"],
+            write_if_changed=False,
+            source_cache_size=64,
+            load_threads=1,
+            snapshot=True,
+            low_memory=False,
+            bytecode_cache='.hyde_bytecode',
+            fragment_cache=None,
+            render_cache=None,
+            render_cache_size=16,
+            refer_cache=False,
             meta={
                 "nodemeta": 'meta.yaml'
             }
@@ -4,12 +4,12 @@ Contains definition for a plugin protocol and other utiltities.
 """
 from hyde._compat import str
 from hyde.exceptions import HydeException
-from hyde.util import first_match, discover_executable
+from hyde.util import first_match, discover_executable, glob_matcher
 from hyde.model import Expando
+from hyde.profiler import timer
 
 import abc
 from functools import partial
-import fnmatch
 import os
 import re
 import subprocess
@@ -73,40 +73,85 @@ class PluginProxy(object):
 
     """
     A proxy class to raise events in registered  plugins
+
+    For every event, the proxy keeps the list of plugins that override the
+    event handler along with their filters. The lists are rebuilt when the
+    plugins of the site are reloaded.
     """
 
-    def __init__(self, site):
+    def __init__(self, site, profiler=None):
         super(PluginProxy, self).__init__()
         self.site = site
+        self.profiler = profiler
+        self.plugins = None
+        self.handlers = {}
+
+    def get_handlers(self, method_name):
+        """
+        Returns a list of (plugin, filter, handler) tuples for the plugins
+        that handle the given event. `template_loaded` is always raised
+        since the base implementation keeps track of the template.
+        """
+        if self.site.plugins is not self.plugins:
+            self.plugins = self.site.plugins
+            self.handlers = {}
+        handlers = self.handlers.get(method_name)
+        if handlers is None:
+            default = _function(getattr(Plugin, method_name))
+            handlers = []
+            for plugin in self.plugins or []:
+                function = getattr(type(plugin), method_name, None)
+                if function is None or (
+                        method_name != 'template_loaded' and
+                        _function(function) is default):
+                    continue
+                handlers.append((plugin,
+                                 getattr(plugin,
+                                         'should_call__' + method_name),
+                                 getattr(plugin, method_name)))
+            self.handlers[method_name] = handlers
+        return handlers
 
     def __getattr__(self, method_name):
-        if hasattr(Plugin, method_name):
-            def __call_plugins__(*args):
-                res = None
-                if self.site.plugins:
-                    for plugin in self.site.plugins:
-                        if hasattr(plugin, method_name):
-                            checker = getattr(
-                                plugin, 'should_call__' + method_name)
-                            if checker(*args):
-                                function = getattr(plugin, method_name)
-                                try:
-                                    res = function(*args)
-                                except:
-                                    HydeException.reraise(
-                                        'Error occured when calling %s' %
-                                        plugin.plugin_name, sys.exc_info())
-                                targs = list(args)
-                                if len(targs):
-                                    last = targs.pop()
-                                    res = res if res else last
-                                    targs.append(res)
-                                    args = tuple(targs)
-                return res
-
-            return __call_plugins__
-        raise HydeException(
-            "Unknown plugin method [%s] called." % method_name)
+        if not hasattr(Plugin, method_name):
+            raise HydeException(
+                "Unknown plugin method [%s] called." % method_name)
+
+        def __call_plugins__(*args):
+            res = None
+            for plugin, checker, function in self.get_handlers(method_name):
+                if not checker(*args):
+                    continue
+                if self.profiler:
+                    start = timer()
+                try:
+                    res = function(*args)
+                except:
+                    HydeException.reraise(
+                        'Error occured when calling %s' %
+                        plugin.plugin_name, sys.exc_info())
+                if self.profiler:
+                    self.profiler.record_hook(
+                        plugin.__class__.__name__,
+                        method_name, timer() - start)
+                if args:
+                    res = res if res else args[-1]
+                    args = args[:-1] + (res,)
+            return res
+
+        self.__dict__[method_name] = __call_plugins__
+        return __call_plugins__
+
+
+def _function(method):
+    """
+    Returns the function behind an unbound method.
+    """
+    return getattr(method, '__func__', method)
+
+
+def _always_true(*args, **kwargs):
+    return True
 
 
 class Plugin(with_metaclass(abc.ABCMeta)):
@@ -115,6 +160,12 @@ class Plugin(with_metaclass(abc.ABCMeta)):
     The plugin protocol
     """
 
+    # Plugins that keep state from the resource events, such as a build
+    # folder created on first use and removed in `site_complete`, set this
+    # to False. The state set by resource events in worker processes is
+    # lost, so such plugins make `hyde gen --jobs` generate serially.
+    parallel_safe = True
+
     def __init__(self, site):
         super(Plugin, self).__init__()
         self.site = site
@@ -131,21 +182,23 @@ class Plugin(with_metaclass(abc.ABCMeta)):
         """
         self.template = template
 
-    def __getattribute__(self, name):
+    def __getattr__(self, name):
         """
-        Syntactic sugar for template methods
+        Syntactic sugar for template methods. This is only called for
+        attributes that are not found the usual way.
         """
         result = None
-        if name.startswith('t_') and self.template:
+        template = self.__dict__.get('template')
+        if name.startswith('t_') and template:
             attr = name[2:]
-            if hasattr(self.template, attr):
-                result = self.template[attr]
+            if hasattr(template, attr):
+                result = template[attr]
             elif attr.endswith('_close_tag'):
                 tag = attr.replace('_close_tag', '')
-                result = partial(self.template.get_close_tag, tag)
+                result = partial(template.get_close_tag, tag)
             elif attr.endswith('_open_tag'):
                 tag = attr.replace('_open_tag', '')
-                result = partial(self.template.get_open_tag, tag)
+                result = partial(template.get_open_tag, tag)
         elif name.startswith('should_call__'):
             (_, _, method) = name.rpartition('__')
             if (method in ('begin_text_resource', 'text_resource_complete',
@@ -155,11 +208,12 @@ class Plugin(with_metaclass(abc.ABCMeta)):
             elif (method in ('begin_node', 'node_complete')):
                 result = self._dir_filter
             else:
-                def always_true(*args, **kwargs):
-                    return True
-                result = always_true
+                result = _always_true
 
-        return result if result else super(Plugin, self).__getattribute__(name)
+        if not result:
+            raise AttributeError("'%s' object has no attribute '%s'" %
+                                 (self.__class__.__name__, name))
+        return result
 
     @property
     def settings(self):
@@ -198,6 +252,21 @@ class Plugin(with_metaclass(abc.ABCMeta)):
         """
         pass
 
+    def resource_added(self, resource):
+        """
+        Called when a resource has been added to a site that is already
+        loaded, for example when a file is created while the site is
+        being watched.
+        """
+        pass
+
+    def resource_removed(self, resource):
+        """
+        Called when a resource has been removed from a site that is
+        already loaded. The resource is no longer part of the content.
+        """
+        pass
+
     def begin_node(self, node):
         """
         Called when a node is about to be processed for generation.
@@ -220,8 +289,7 @@ class Plugin(with_metaclass(abc.ABCMeta)):
                 filters = [filters]
         except AttributeError:
             filters = None
-        result = any(fnmatch.fnmatch(resource.path, f)
-                     for f in filters) if filters else True
+        result = glob_matcher(filters)(resource.path) if filters else True
         return result
 
     def _dir_filter(self, node, *args, **kwargs):
@@ -322,11 +390,11 @@ class Plugin(with_metaclass(abc.ABCMeta)):
                         for name in site.config.plugins]
 
     @staticmethod
-    def get_proxy(site):
+    def get_proxy(site, profiler=None):
         """
         Returns a new instance of the Plugin proxy.
         """
-        return PluginProxy(site)
+        return PluginProxy(site, profiler)
 
 
 class CLTransformer(Plugin):
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Collects timings of plugin hooks and resource generation.
+"""
+from contextlib import contextmanager
+import json
+import os
+import time
+
+from hyde._compat import iteritems
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class Profiler(object):
+
+    """
+    Records the time spent in every plugin hook and in every step of
+    generating a resource (render, copy and write).
+    """
+
+    def __init__(self):
+        super(Profiler, self).__init__()
+        self.reset()
+
+    def reset(self):
+        """
+        Discards the recorded timings.
+        """
+        self.hooks = {}
+        self.resources = {}
+
+    def record_hook(self, plugin, hook, seconds):
+        """
+        Records a call to the given plugin hook.
+        """
+        key = (plugin, hook)
+        calls, total = self.hooks.get(key, (0, 0.0))
+        self.hooks[key] = (calls + 1, total + seconds)
+
+    def record_resource(self, path, step, seconds):
+        """
+        Records the time taken by a step in generating the given resource.
+        """
+        steps = self.resources.setdefault(path, {})
+        steps[step] = steps.get(step, 0.0) + seconds
+
+    @contextmanager
+    def timed_resource(self, path, step):
+        """
+        Context manager that records the time spent in the block as a step
+        in generating the given resource.
+        """
+        start = timer()
+        try:
+            yield
+        finally:
+            self.record_resource(path, step, timer() - start)
+
+    def get_state(self):
+        """
+        Returns the recorded timings in a form that can be sent
+        from a worker process.
+        """
+        return dict(hooks=list(self.hooks.items()),
+                    resources=self.resources)
+
+    def merge(self, state):
+        """
+        Adds the timings recorded by a worker process.
+        """
+        for key, (calls, total) in state['hooks']:
+            key = tuple(key)
+            old_calls, old_total = self.hooks.get(key, (0, 0.0))
+            self.hooks[key] = (old_calls + calls, old_total + total)
+        for path, steps in iteritems(state['resources']):
+            for step, seconds in iteritems(steps):
+                self.record_resource(path, step, seconds)
+
+    def to_dict(self, top=None):
+        """
+        Returns the profile sorted from the slowest to the fastest
+        resources, plugins and hooks.
+        """
+        resources = [dict(steps, path=path, total=sum(steps.values()))
+                     for path, steps in iteritems(self.resources)]
+        resources.sort(key=lambda item: (-item['total'], item['path']))
+        plugins = {}
+        hooks = {}
+        plugin_hooks = []
+        for (plugin, hook), (calls, total) in iteritems(self.hooks):
+            plugins[plugin] = plugins.get(plugin, 0.0) + total
+            hooks[hook] = hooks.get(hook, 0.0) + total
+            plugin_hooks.append(dict(plugin=plugin, hook=hook,
+                                     calls=calls, total=total))
+        plugin_hooks.sort(key=lambda item: (-item['total'],
+                                            item['plugin'], item['hook']))
+
+        def by_time(totals):
+            return [dict(name=name, total=total) for name, total in
+                    sorted(totals.items(), key=lambda item: (-item[1],
+                                                             item[0]))]
+
+        return dict(resources=resources[:top] if top else resources,
+                    plugins=by_time(plugins),
+                    hooks=by_time(hooks),
+                    plugin_hooks=plugin_hooks)
+
+    def report(self, top=20):
+        """
+        Returns the profile as text with the `top` slowest resources.
+        """
+        profile = self.to_dict(top)
+        lines = ['Slowest resources:']
+        for item in profile['resources']:
+            steps = ', '.join('%s %.4fs' % (step, item[step])
+                              for step in ('render', 'copy', 'write')
+                              if step in item)
+            lines.append('  %9.4fs  %s (%s)' % (item['total'], item['path'],
+                                                steps))
+        lines.append('Time per plugin:')
+        for item in profile['plugins']:
+            lines.append('  %9.4fs  %s' % (item['total'], item['name']))
+        lines.append('Time per hook:')
+        for item in profile['hooks']:
+            lines.append('  %9.4fs  %s' % (item['total'], item['name']))
+        lines.append('Time per plugin hook:')
+        for item in profile['plugin_hooks']:
+            lines.append('  %9.4fs  %s.%s (%d calls)' % (
+                item['total'], item['plugin'], item['hook'], item['calls']))
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path, top=20):
+        """
+        Writes the profile as JSON to the given path and as text
+        to the same path with a `.txt` extension.
+        """
+        with open(path, 'w') as stream:
+            json.dump(self.to_dict(), stream, indent=2, sort_keys=True)
+        text_path = os.path.splitext(path)[0] + '.txt'
+        if text_path == path:
+            text_path = path + '.txt'
+        with open(text_path, 'w') as stream:
+            stream.write(self.report(top))
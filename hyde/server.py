@@ -3,6 +3,7 @@
 Contains classes and utilities for serving a site
 generated from hyde.
 """
+import os
 import threading
 import urllib
 import traceback
@@ -12,6 +13,7 @@ from datetime import datetime
 from hyde._compat import (HTTPServer, iteritems, parse, PY3,
                           SimpleHTTPRequestHandler, unquote)
 from hyde.generator import Generator
+from hyde.watcher import PollingObserver, Watcher
 
 from fswrap import File, Folder
 
@@ -56,6 +58,7 @@ class HydeRequestHandler(SimpleHTTPRequestHandler):
         referring to the `site` variable in the server.
         """
         site = self.server.site
+        self.server.refresh()
         path = unquote(self.path)
         if not PY3:
             path = path.decode('utf-8')
@@ -84,14 +87,16 @@ class HydeRequestHandler(SimpleHTTPRequestHandler):
                         return new_path
         else:
             res = site.content.resource_from_relative_deploy_path(path)
+            if not res or not File(res.path).exists:
+                res = self.server.refresh_resource(path, res)
 
         if not res:
             logger.error("Cannot load file: [%s]" % path)
             return site.config.deploy_root_path.child(path)
-        else:
-            self.server.generate_resource(res)
         new_path = site.config.deploy_root_path.child(
             res.relative_deploy_path)
+        if not File(new_path).exists:
+            self.server.generate_resource(res)
         return new_path
 
     def do_404(self):
@@ -132,10 +137,18 @@ class HydeWebServer(HTTPServer):
     a request is issued.
     """
 
+    # Use polling instead of inotify to detect changes.
+    poll = False
+
     def __init__(self, site, address, port):
         self.site = site
         self.site.load()
         self.generator = Generator(self.site)
+        self.watcher = None
+        self.changes = (set(), set(), set())
+        self.changes_lock = threading.Lock()
+        self.polling = None
+        self.stop_polling = threading.Event()
         self.request_time = datetime.strptime('1-1-1999', '%m-%d-%Y')
         self.regeneration_time = datetime.strptime('1-1-1998', '%m-%d-%Y')
         self.__is_shut_down = threading.Event()
@@ -209,3 +222,104 @@ class HydeWebServer(HTTPServer):
                 'Error [%s] occured when serving the resource [%s]'
                 % (repr(exception), resource))
             logger.debug(traceback.format_exc())
+
+    def refresh(self):
+        """
+        Regenerates the resources affected by the files that have changed
+        since the previous request. The first request generates the
+        resources that have changed since the last generation and starts
+        watching the site.
+        """
+        if self.watcher is None:
+            self.watcher = Watcher(self.site, self.generator, poll=self.poll)
+            try:
+                self.watcher.start()
+            except Exception as exception:
+                logger.error(
+                    'Error [%s] occured when generating the site'
+                    % repr(exception))
+                logger.debug(traceback.format_exc())
+            if isinstance(self.watcher.observer, PollingObserver):
+                self.polling = threading.Thread(target=self.poll_changes)
+                self.polling.daemon = True
+                self.polling.start()
+            return
+        if self.polling:
+            with self.changes_lock:
+                changes = self.changes
+                self.changes = (set(), set(), set())
+        else:
+            changes = self.watcher.observer.read_changes(0)
+        if any(changes):
+            self.generate_changed(*changes)
+
+    def poll_changes(self):
+        """
+        Scans the site for changes in the background, so that requests
+        never wait for a scan. The changes are collected until the next
+        request.
+        """
+        observer = self.watcher.observer
+        while not self.stop_polling.is_set():
+            changes = observer.read_changes(observer.interval)
+            if any(changes):
+                with self.changes_lock:
+                    for found, pending in zip(changes, self.changes):
+                        pending.update(found)
+
+    def server_close(self):
+        """
+        Stops watching the site and closes the socket.
+        """
+        self.stop_polling.set()
+        if self.polling:
+            self.polling.join()
+            self.polling = None
+        if self.watcher:
+            self.watcher.stop()
+        HTTPServer.server_close(self)
+
+    def generate_changed(self, modified, created=(), deleted=()):
+        """
+        Updates the site with the created and deleted files and
+        regenerates the resources affected by all the given files.
+        """
+        deploy = self.site.config.deploy_root_path
+        if not deploy.exists:
+            return self.regenerate()
+        try:
+            deleted = [path for path in deleted if not os.path.exists(path)]
+            changed = set(modified) | set(created) | set(deleted)
+            logger.info('Regenerating resources affected by %s'
+                        % ', '.join(sorted(changed)))
+            self.generator.apply_changes(created, deleted, modified)
+        except Exception as exception:
+            logger.error(
+                'Error [%s] occured when regenerating changed files'
+                % repr(exception))
+            logger.debug(traceback.format_exc())
+
+    def refresh_resource(self, path, resource=None):
+        """
+        Updates the site model when the content file at the given relative
+        path has been created, or when the source of the given resource
+        has been deleted, since the site was loaded. Returns the resource
+        to serve, if any.
+        """
+        try:
+            if resource:
+                logger.info('Removing deleted resource [%s]' % resource)
+                self.generator.apply_changes(deleted=[resource.path])
+                return None
+            source = File(self.site.content.source_folder.child(path))
+            if not source.exists:
+                return None
+            logger.info('Adding new resource [%s]' % path)
+            added, _ = self.generator.apply_changes(created=[source.path])
+            return added[0] if added else None
+        except Exception as exception:
+            logger.error(
+                'Error [%s] occured when updating the site for [%s]'
+                % (repr(exception), path))
+            logger.debug(traceback.format_exc())
+        return None
@@ -2,17 +2,22 @@
 """
 Parses & holds information about the site to be generated.
 """
+import hashlib
+import json
 import os
-import fnmatch
 import sys
+from collections import OrderedDict
 from functools import wraps
+from multiprocessing.pool import ThreadPool
 
-from hyde._compat import parse, quote, str
+from hyde._compat import parse, quote, scandir, str
 from hyde.exceptions import HydeException
-from hyde.model import Config
+from hyde.model import Config, Snapshot
+from hyde.util import SortedList, glob_matcher
+from hyde.version import __version__
 
 from commando.util import getLoggerWithNullHandler
-from fswrap import FS, File, Folder
+from fswrap import File, Folder
 
 
 def path_normalized(f):
@@ -27,14 +32,21 @@ logger = getLoggerWithNullHandler('hyde.engine')
 class Processable(object):
     """
     A node or resource.
+
+    The core fields are kept in slots to keep the model compact for
+    large sites. Plugins can still attach any other attribute, those
+    are kept in the instance dictionary.
     """
 
-    def __init__(self, source):
+    __slots__ = ('_relative_deploy_path', '_url', '_full_url', '__dict__')
+
+    def __init__(self):
         super(Processable, self).__init__()
-        self.source = FS.file_or_folder(source)
         self.is_processable = True
         self.uses_template = True
         self._relative_deploy_path = None
+        self._url = None
+        self._full_url = None
 
     @property
     def name(self):
@@ -47,10 +59,10 @@ class Processable(object):
         return self.path
 
     def __lt__(self, other):
-        return self.source.path < other.source.path
+        return self.path < other.path
 
     def __gt__(self, other):
-        return self.source.path > other.source.path
+        return self.path > other.path
 
     @property
     def path(self):
@@ -74,6 +86,8 @@ class Processable(object):
         after its been processed.
         """
         self._relative_deploy_path = path
+        self._url = None
+        self._full_url = None
         self.site.content.deploy_path_changed(self)
 
     relative_deploy_path = property(get_relative_deploy_path,
@@ -84,44 +98,164 @@ class Processable(object):
         """
         Returns the relative url for the processable
         """
-        return '/' + self.relative_deploy_path
+        url = self._url
+        if url is None:
+            url = self._url = '/' + self.relative_deploy_path
+        return url
 
     @property
     def full_url(self):
         """
-        Returns the full url for the processable.
+        Returns the full url for the processable. The url is computed
+        again when the url settings of the site change.
         """
-        return self.site.full_url(self.relative_deploy_path)
+        site = self.site
+        settings = site.url_settings()
+        cached = self._full_url
+        if cached is not None and cached[0] == settings:
+            return cached[1]
+        url = site.full_url(self.relative_deploy_path)
+        self._full_url = (settings, url)
+        return url
 
 
 class Resource(Processable):
     """
     Represents any file that is processed by hyde
+
+    Only the source path is kept, the same string that the root node
+    uses to look the resource up. The `File` object for the source is
+    created when it is asked for.
     """
 
+    __slots__ = ('node', 'simple_copy', '_path', '_is_processable',
+                 '_uses_template', '_loader')
+
     def __init__(self, source_file, node):
-        super(Resource, self).__init__(source_file)
-        self.source_file = source_file
+        self._loader = None
+        super(Resource, self).__init__()
         if not node:
             raise HydeException("Resource cannot exist without a node")
         if not source_file:
             raise HydeException("Source file is required"
                                 " to instantiate a resource")
         self.node = node
-        self.site = node.site
         self.simple_copy = False
+        self._path = source_file.path if isinstance(source_file, File) \
+            else str(source_file)
+
+    def set_loader(self, loader):
+        """
+        Defers work on this resource until it is needed. `loader` is
+        called with the resource the first time an attribute that is not
+        set on it, `is_processable` or `uses_template` is used. Plugins
+        use it to attach attributes like `meta` lazily.
+        """
+        self._loader = loader
+
+    def load(self):
+        """
+        Calls the pending loader, if any.
+        """
+        loader = self._loader
+        if loader is not None:
+            self._loader = None
+            loader(self)
+
+    def __getattr__(self, name):
+        # Only called when the attribute is not found.
+        if name.startswith('_') or self._loader is None:
+            raise AttributeError(name)
+        self.load()
+        return getattr(self, name)
+
+    def get_is_processable(self):
+        """
+        Whether the resource is generated.
+        """
+        if self._loader is not None:
+            self.load()
+        return self._is_processable
+
+    def set_is_processable(self, value):
+        if self._loader is not None:
+            self.load()
+        self._is_processable = value
+
+    is_processable = property(get_is_processable, set_is_processable)
+
+    def get_uses_template(self):
+        """
+        Whether the resource is rendered by the template engine.
+        """
+        if self._loader is not None:
+            self.load()
+        return self._uses_template
+
+    def set_uses_template(self, value):
+        if self._loader is not None:
+            self.load()
+        self._uses_template = value
+
+    uses_template = property(get_uses_template, set_uses_template)
+
+    @property
+    def site(self):
+        """
+        The site this resource belongs to.
+        """
+        return self.node.site
+
+    @property
+    def path(self):
+        """
+        Gets the source path of this resource.
+        """
+        return self._path
+
+    @property
+    def source_file(self):
+        """
+        The source file of this resource.
+        """
+        return File(self._path)
+
+    source = source_file
+
+    @property
+    def name(self):
+        """
+        The resource name
+        """
+        return os.path.basename(self._path)
 
     @property
     def relative_path(self):
         """
         Gets the path relative to the root folder (Content)
         """
-        return self.source_file.get_relative_path(self.node.root.source_folder)
+        root = self.node.root.source_folder.path
+        path = self._path
+        length = len(root)
+        if path[length:length + 1] == os.sep and path.startswith(root):
+            return path[length + 1:]
+        return File(path).get_relative_path(root)
 
     @property
     def slug(self):
         # TODO: Add a more sophisticated slugify method
-        return self.source.name_without_extension
+        return os.path.splitext(self.name)[0]
+
+    def read_source(self):
+        """
+        Returns the text of the source file. The text is shared with the
+        plugins and the template loader through the source cache of the
+        site.
+        """
+        cache = getattr(self.site, 'source_cache', None)
+        if cache is None:
+            return self.source_file.read_all()
+        return cache.read(self.source_file)
 
 
 class Node(Processable):
@@ -129,22 +263,36 @@ class Node(Processable):
     Represents any folder that is processed by hyde
     """
 
+    __slots__ = ('is_processable', 'uses_template', 'source_folder', 'parent',
+                 'root', 'module', 'site', 'child_nodes', 'resources',
+                 '_relative_path')
+
     def __init__(self, source_folder, parent=None):
-        super(Node, self).__init__(source_folder)
+        super(Node, self).__init__()
         if not source_folder:
             raise HydeException("Source folder is required"
                                 " to instantiate a node.")
         self.root = self
         self.module = None
         self.site = None
-        self.source_folder = Folder(str(source_folder))
+        self.source_folder = source_folder \
+            if isinstance(source_folder, Folder) \
+            else Folder(str(source_folder))
         self.parent = parent
         if parent:
             self.root = self.parent.root
             self.module = self.parent.module if self.parent.module else self
             self.site = parent.site
-        self.child_nodes = []
-        self.resources = []
+        self.child_nodes = SortedList()
+        self.resources = SortedList()
+        self._relative_path = None
+
+    @property
+    def source(self):
+        """
+        The source folder of this node.
+        """
+        return self.source_folder
 
     def contains_resource(self, resource_name):
         """
@@ -196,10 +344,11 @@ class Node(Processable):
         Walks the node, first yielding itself then
         yielding the child nodes depth-first.
         """
-        yield self
-        for child in sorted([node for node in self.child_nodes]):
-            for node in child.walk():
-                yield node
+        pending = [self]
+        while pending:
+            node = pending.pop()
+            yield node
+            pending.extend(reversed(node.child_nodes))
 
     def rwalk(self):
         """
@@ -216,7 +365,7 @@ class Node(Processable):
         Walks the resources in this hierarchy.
         """
         for node in self.walk():
-            for resource in sorted([resource for resource in node.resources]):
+            for resource in node.resources:
                 yield resource
 
     @property
@@ -224,7 +373,11 @@ class Node(Processable):
         """
         Gets the path relative to the root folder (Content, Media, Layout)
         """
-        return self.source_folder.get_relative_path(self.root.source_folder)
+        path = self._relative_path
+        if path is None:
+            path = self._relative_path = self.source_folder.get_relative_path(
+                self.root.source_folder)
+        return path
 
 
 class RootNode(Node):
@@ -352,45 +505,256 @@ class RootNode(Node):
             node = self.add_node(afile.parent)
         resource = node.add_child_resource(afile)
         self.resource_map[str(afile)] = resource
-        relative_path = resource.relative_path
-        resource.simple_copy = any(fnmatch.fnmatch(relative_path, pattern)
-                                   for pattern in self.site.config.simple_copy)
+        resource.simple_copy = glob_matcher(self.site.config.simple_copy)(
+            resource.relative_path)
 
         logger.debug("Added resource [%s] to [%s]" %
                      (resource.relative_path, self.source_folder))
         return resource
 
+    def add_tree(self, a_folder):
+        """
+        Adds the folder at the given path along with the files and
+        folders under it. Returns the resources that were added.
+        """
+        folder = Folder(a_folder)
+        if folder == self.source_folder:
+            raise HydeException("The root folder [%s] cannot be added"
+                                " again" % folder)
+        config = self.site.config
+        self.is_ignored = glob_matcher(config.ignore)
+        self.is_simple_copy = glob_matcher(config.simple_copy)
+        node = self.add_node(folder)
+        existing = set(node.walk_resources())
+        self.__load_tree__(node)
+        return [resource for resource in node.walk_resources()
+                if resource not in existing]
+
+    def remove_resource(self, a_file):
+        """
+        Removes the resource at the given path from its node and from
+        the lookup tables. Returns the removed resource, or None if there
+        is no resource at the path.
+        """
+        resource = self.resource_from_path(a_file)
+        if not resource:
+            return None
+        resource.node.resources.remove(resource)
+        del self.resource_map[resource.path]
+        for path, item in list(self.resource_deploy_map.items()):
+            if item is resource:
+                del self.resource_deploy_map[path]
+        cache = getattr(self.site, 'source_cache', None)
+        if cache is not None:
+            cache.discard(resource.path)
+        logger.debug("Removed resource [%s] from [%s]" %
+                     (resource.relative_path, self.source_folder))
+        return resource
+
+    def remove_node(self, a_folder):
+        """
+        Removes the node at the given path along with the nodes and
+        resources under it. Returns the removed resources.
+        """
+        node = self.node_from_path(a_folder)
+        if not node:
+            return []
+        if node is self:
+            raise HydeException("The root node [%s] cannot be removed" %
+                                self.source_folder)
+        removed = []
+        for child in list(node.walk()):
+            for resource in list(child.resources):
+                removed.append(self.remove_resource(resource.path))
+            self.node_map.pop(child.source_folder.path, None)
+        node.parent.child_nodes.remove(node)
+        logger.debug("Removed node [%s] from [%s]" %
+                     (node.relative_path, self.source_folder))
+        return removed
+
+    def move(self, source, target):
+        """
+        Moves the file or folder at the `source` path to the `target`
+        path. The moved resources are replaced with new ones. Returns a
+        tuple containing the lists of added and removed resources.
+        """
+        return self.apply_changes(created=[target], deleted=[source])
+
+    def apply_changes(self, created=(), deleted=()):
+        """
+        Updates the hierarchy with the files and folders that have been
+        created or deleted on disk since it was loaded. Deleted paths are
+        removed first so that a path can be replaced. Paths outside the
+        source folder and paths with ignored names are skipped. Returns a
+        tuple containing the lists of added and removed resources.
+        """
+        is_ignored = glob_matcher(self.site.config.ignore)
+        removed = []
+        for path in sorted(deleted, reverse=True):
+            if self.resource_from_path(path):
+                removed.append(self.remove_resource(path))
+            elif self.node_from_path(path) not in (None, self):
+                removed.extend(self.remove_node(path))
+        added = []
+        for path in sorted(created):
+            path = os.path.abspath(str(path))
+            afile = File(path)
+            if afile == self.source_folder or \
+                    not afile.is_descendant_of(self.source_folder):
+                continue
+            relative_path = afile.get_relative_path(self.source_folder)
+            if any(is_ignored(name)
+                   for name in relative_path.split(os.sep)):
+                continue
+            if os.path.isdir(path):
+                added.extend(self.add_tree(path))
+            elif os.path.isfile(path) and not self.resource_from_path(path):
+                added.append(self.add_resource(path))
+        return added, removed
+
     def load(self):
         """
         Walks the `source_folder` and loads the sitemap.
         Creates nodes and resources, reads metadata and injects attributes.
         This is the model for hyde.
+
+        If `load_threads` is more than 1 in the configuration, the top
+        level folders are loaded in parallel threads.
         """
 
         if not self.source_folder.exists:
             raise HydeException("The given source folder [%s]"
                                 " does not exist" % self.source_folder)
 
-        with self.source_folder.walker as walker:
+        config = self.site.config
+        self.is_ignored = glob_matcher(config.ignore)
+        self.is_simple_copy = glob_matcher(config.simple_copy)
+        if self.is_ignored(self.source_folder.name):
+            logger.debug("Ignoring node: %s" % self.source_folder.name)
+            return
+
+        folders = self.__load_folder__(self)
+        threads = config.load_threads
+        if threads > 1 and len(folders) > 1:
+            pool = ThreadPool(min(threads, len(folders)))
+            try:
+                pool.map(self.__load_tree__, folders)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for node in folders:
+                self.__load_tree__(node)
+
+    def __load_tree__(self, node):
+        pending = [node]
+        while pending:
+            pending.extend(self.__load_folder__(pending.pop()))
+
+    def __load_folder__(self, node):
+        """
+        Adds the files and folders directly under the given node.
+        Returns the nodes for the folders.
+        """
+        folders = []
+        snapshot = getattr(self.site, 'snapshot', None)
+        path = node.source_folder.path
+        entries = snapshot.listing(path, _scan) if snapshot else _scan(path)
+        for name, path, is_dir in sorted(entries):
+            if self.is_ignored(name):
+                logger.debug("Ignoring: %s" % name)
+                continue
+            if is_dir:
+                child = self.node_map.get(path)
+                if not child:
+                    child = Node(Folder(path), node)
+                    node.child_nodes.append(child)
+                    self.node_map[child.source_folder.path] = child
+                folders.append(child)
+            elif path not in self.resource_map:
+                resource = Resource(path, node)
+                node.resources.append(resource)
+                self.resource_map[path] = resource
+                resource.simple_copy = self.is_simple_copy(
+                    resource.relative_path)
+        return folders
+
+
+class SourceCache(object):
+    """
+    Keeps the text of the source files that have been read recently, so
+    that every file is read and decoded only once. An entry is used only
+    while the modification time and the size of the file are unchanged.
+    The least recently used entries are evicted when the total length
+    of the cached text goes beyond `max_size`.
+    """
 
-            def dont_ignore(name):
-                for pattern in self.site.config.ignore:
-                    if fnmatch.fnmatch(name, pattern):
-                        return False
-                return True
+    def __init__(self, max_size):
+        super(SourceCache, self).__init__()
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, afile):
+        """
+        Returns the text of the given file.
+        """
+        path = afile.path
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.discard(path)
+            return afile.read_all()
+        key = (stat.st_mtime, stat.st_size)
+        text = None
+        entry = self.entries.pop(path, None)
+        if entry:
+            self.size -= len(entry[1])
+            if entry[0] == key:
+                text = entry[1]
+        if text is None:
+            self.misses += 1
+            text = afile.read_all()
+        else:
+            self.hits += 1
+        if len(text) <= self.max_size:
+            self.entries[path] = (key, text)
+            self.size += len(text)
+            while self.size > self.max_size:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+        return text
 
-            @walker.folder_visitor
-            def visit_folder(folder):
-                if dont_ignore(folder.name):
-                    self.add_node(folder)
-                else:
-                    logger.debug("Ignoring node: %s" % folder.name)
-                    return False
+    def discard(self, path):
+        """
+        Removes the text of the file at the given path from the cache.
+        """
+        entry = self.entries.pop(path, None)
+        if entry:
+            self.size -= len(entry[1])
 
-            @walker.file_visitor
-            def visit_file(afile):
-                if dont_ignore(afile.name):
-                    self.add_resource(afile)
+    def clear(self):
+        """
+        Empties the cache.
+        """
+        self.entries.clear()
+        self.size = 0
+
+
+def _scan(path):
+    """
+    Yields the name, the path and whether it is a folder for every
+    entry in the folder at the given path.
+    """
+    if scandir:
+        for entry in scandir(path):
+            yield entry.name, entry.path, entry.is_dir()
+    else:
+        for name in os.listdir(path):
+            child = os.path.join(path, name)
+            yield name, child, os.path.isdir(child)
 
 
 def _encode_path(base, path, safe):
@@ -406,6 +770,8 @@ class Site(object):
     Represents the site to be generated.
     """
 
+    url_cache_size = 100000
+
     def __init__(self, sitepath=None, config=None):
         super(Site, self).__init__()
         self.sitepath = Folder(Folder(sitepath).fully_expanded_path)
@@ -417,6 +783,11 @@ class Site(object):
         self.content = RootNode(self.config.content_root_path, self)
         self.plugins = []
         self.context = {}
+        self.source_cache = SourceCache(
+            int(self.config.source_cache_size * 1024 * 1024))
+        self.snapshot = None
+        self._urls = {}
+        self._url_settings = None
 
     def refresh_config(self):
         """
@@ -440,8 +811,38 @@ class Site(object):
         """
         Walks the content and media folders to load up the sitemap.
         """
+        self.open_snapshot()
         self.content.load()
 
+    def open_snapshot(self):
+        """
+        Opens the snapshot of the site model that was saved by the last
+        generation, unless it is disabled in the configuration or the site
+        is generated in low memory mode. The snapshot is not used if the
+        configuration, including the list of plugins, has changed since
+        then. The key does not depend on the loaded plugins, since the
+        site may be loaded before them.
+        """
+        if not self.config.snapshot or self.config.low_memory:
+            self.snapshot = None
+            return None
+        config = self.config.to_dict()
+        for key in ('load_time', 'config_files'):
+            config.pop(key, None)
+        data = json.dumps(dict(config=config, version=__version__),
+                          default=repr, sort_keys=True)
+        key = hashlib.sha1(data.encode('utf-8')).hexdigest()
+        if not self.snapshot or self.snapshot.key != key:
+            self.snapshot = Snapshot(self.sitepath, key)
+        return self.snapshot
+
+    def reload(self):
+        """
+        Discards the sitemap and loads it again from the content folder.
+        """
+        self.content = RootNode(self.config.content_root_path, self)
+        self.load()
+
     def _safe_chars(self, safe=None):
         if safe is not None:
             return safe
@@ -450,6 +851,15 @@ class Site(object):
         else:
             return None
 
+    def url_settings(self):
+        """
+        Returns the configuration values that the urls of the resources
+        depend on.
+        """
+        config = self.config
+        return (config, config.base_url, config.media_url,
+                config.content_root, config.media_root, config.encode_safe)
+
     def content_url(self, path, safe=None):
         """
         Returns the content url by appending the base url from the config
@@ -465,25 +875,59 @@ class Site(object):
         return _encode_path(self.config.media_url, path,
                             self._safe_chars(safe))
 
+    def url_cache(self):
+        """
+        Returns the cache of full urls. The cache is emptied when the url
+        settings change or when it holds `url_cache_size` urls.
+        """
+        settings = self.url_settings()
+        if settings != self._url_settings or \
+                len(self._urls) >= self.url_cache_size:
+            self._url_settings = settings
+            self._urls = {}
+            self._content_path = os.path.normpath(
+                self.content.source_folder.path)
+            self._media_prefix = os.path.normpath(
+                self.config.media_root_path.path) + os.sep
+        return self._urls
+
     def full_url(self, path, safe=None):
         """
         Determines if the given path is media or content based on the
         configuration and returns the appropriate url. The return value
         is url encoded.
         """
+        urls = self.url_cache()
+        key = (path, safe)
+        url = urls.get(key)
+        if url is None:
+            url = urls[key] = self._full_url(path, safe)
+        return url
+
+    def _full_url(self, path, safe=None):
         if parse.urlparse(path)[:2] != ("", ""):
             return path
 
-        if self.is_media(path):
-            relative_path = File(path).get_relative_path(
-                Folder(self.config.media_root))
-            return self.media_url(relative_path, safe)
+        media_path = self._media_path(path)
+        if media_path is not None:
+            return self.media_url(media_path, safe)
         else:
             return self.content_url(path, safe)
 
+    def _media_path(self, path):
+        """
+        Returns the path relative to the media folder if the given path,
+        relative to the content folder, is inside it. Returns None
+        otherwise.
+        """
+        self.url_cache()
+        full_path = os.path.normpath(os.path.join(self._content_path, path))
+        if full_path.startswith(self._media_prefix):
+            return full_path[len(self._media_prefix):]
+        return None
+
     def is_media(self, path):
         """
         Given the relative path, determines if it is content or media.
         """
-        folder = self.content.source.child_folder(path)
-        return folder.is_descendant_of(self.config.media_root_path)
+        return self._media_path(path) is not None
@@ -25,11 +25,20 @@ class HtmlWrap(object):
     def __init__(self, html):
         super(HtmlWrap, self).__init__()
         self.raw = html
-        try:
-            from pyquery import PyQuery
-        except:
-            PyQuery = None
-        self.q = PyQuery(html) if PyQuery else None
+        self._q = False
+
+    @property
+    def q(self):
+        """
+        Parses the html the first time it is queried.
+        """
+        if self._q is False:
+            try:
+                from pyquery import PyQuery
+            except ImportError:
+                PyQuery = None
+            self._q = PyQuery(self.raw) if PyQuery else None
+        return self._q
 
     def __str__(self):
         return self.raw
@@ -80,6 +89,20 @@ class Template(with_metaclass(abc.ABCMeta)):
         """
         return
 
+    def cache_stats(self):
+        """
+        Returns a dictionary that maps the name of every cache used by the
+        template engine to a tuple with its number of hits and misses.
+        """
+        return {}
+
+    def release_resource(self, resource):
+        """
+        Drops anything kept in memory for the given resource after it has
+        been generated. Called in low memory mode.
+        """
+        return
+
     def get_dependencies(self, text):
         """
         Finds the dependencies based on the included
@@ -1,11 +1,17 @@
 """
 Module for python 2.6 compatibility.
 """
+import bisect
+import fnmatch
+import hashlib
 import os
+import re
+import sys
+import tempfile
 from functools import partial
 from itertools import tee
 
-from hyde._compat import str, zip
+from hyde._compat import replace, str, zip
 
 
 def make_method(method_name, method_):
@@ -57,3 +63,180 @@ def discover_executable(name, sitepath):
         if os.path.exists(full_name):
             return full_name
     return None
+
+
+def file_digest(path):
+    """
+    Returns the sha1 hex digest of the contents of the file at
+    the given path or None if the file does not exist.
+    """
+    digest = hashlib.sha1()
+    try:
+        with open(path, 'rb') as fin:
+            for chunk in iter(partial(fin.read, 64 * 1024), b''):
+                digest.update(chunk)
+    except (IOError, OSError):
+        return None
+    return digest.hexdigest()
+
+
+class GlobMatcher(object):
+    """
+    Checks if a name matches any of the given glob patterns. Matches the
+    same names as `fnmatch.fnmatch`.
+
+    Patterns without wildcards are looked up in a set and patterns like
+    `*.ext` and `prefix*` are checked with `str.endswith` and
+    `str.startswith`. All the other patterns are combined into a single
+    regular expression.
+    """
+
+    def __init__(self, patterns):
+        super(GlobMatcher, self).__init__()
+        self.patterns = tuple(patterns or ())
+        exact = set()
+        suffixes = []
+        prefixes = []
+        others = []
+        for pattern in self.patterns:
+            pattern = os.path.normcase(pattern)
+            if not _has_magic(pattern):
+                exact.add(pattern)
+            elif pattern.startswith('*') and not _has_magic(pattern[1:]):
+                suffixes.append(pattern[1:])
+            elif pattern.endswith('*') and not _has_magic(pattern[:-1]):
+                prefixes.append(pattern[:-1])
+            else:
+                others.append(pattern)
+        self.exact = frozenset(exact)
+        self.suffixes = tuple(suffixes)
+        self.prefixes = tuple(prefixes)
+        self.regex = re.compile('|'.join(
+            '(?:%s)' % fnmatch.translate(pattern)
+            for pattern in others)) if others else None
+        self.normcase = os.path.normcase('A') != 'A'
+
+    def __call__(self, name):
+        if self.normcase:
+            name = os.path.normcase(name)
+        return (name in self.exact or
+                bool(self.suffixes) and name.endswith(self.suffixes) or
+                bool(self.prefixes) and name.startswith(self.prefixes) or
+                self.regex is not None and
+                self.regex.match(name) is not None)
+
+    def __repr__(self):
+        return 'GlobMatcher(%r)' % (self.patterns,)
+
+
+def _has_magic(pattern):
+    return '*' in pattern or '?' in pattern or '[' in pattern
+
+
+_matchers = {}
+
+
+def glob_matcher(patterns):
+    """
+    Returns a `GlobMatcher` for the given patterns. Matchers are compiled
+    once and reused for the same list of patterns.
+    """
+    key = tuple(patterns or ())
+    matcher = _matchers.get(key)
+    if matcher is None:
+        if len(_matchers) >= 256:
+            _matchers.clear()
+        matcher = _matchers[key] = GlobMatcher(key)
+    return matcher
+
+
+def has_contents(path, data):
+    """
+    Checks if the file at the given path contains exactly the given bytes.
+    The sizes are compared first so that most changes are found without
+    reading the file.
+    """
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+    except OSError:
+        return False
+    return file_digest(path) == hashlib.sha1(data).hexdigest()
+
+
+def same_file_contents(path, other_path):
+    """
+    Checks if the files at the given paths have the same contents.
+    The sizes are compared first, then the hashes.
+    """
+    try:
+        if os.path.getsize(path) != os.path.getsize(other_path):
+            return False
+    except OSError:
+        return False
+    return file_digest(path) == file_digest(other_path)
+
+
+def write_atomically(path, data):
+    """
+    Writes the given bytes to a temporary file next to `path` and
+    renames it into place, so that readers never see a partial file.
+    """
+    folder = os.path.dirname(str(path))
+    (handle, temp_path) = tempfile.mkstemp(dir=folder, prefix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as fout:
+            fout.write(data)
+        replace(temp_path, str(path))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def peak_memory():
+    """
+    Returns the peak resident set size of this process in bytes, or None
+    if it is not known on this platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class SortedList(list):
+    """
+    A list that keeps its items sorted as they are added. Items that
+    compare equal stay in the order in which they were added.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, iterable=()):
+        super(SortedList, self).__init__(iterable)
+        list.sort(self)
+
+    def append(self, item):
+        if self and item < self[-1]:
+            list.insert(self, bisect.bisect_right(self, item), item)
+        else:
+            list.append(self, item)
+
+    def insert(self, index, item):
+        self.append(item)
+
+    def extend(self, iterable):
+        list.extend(self, iterable)
+        list.sort(self)
+
+    def __iadd__(self, iterable):
+        self.extend(iterable)
+        return self
+
+    def __setitem__(self, index, item):
+        list.__setitem__(self, index, item)
+        list.sort(self)
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Watches the site for changes and regenerates the affected resources.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from commando.util import getLoggerWithNullHandler
+from fswrap import File, Folder
+
+from hyde.util import glob_matcher
+
+logger = getLoggerWithNullHandler('hyde.engine')
+
+
+class PollingObserver(object):
+
+    """
+    Detects changes by comparing the modification times and sizes of the
+    files in the watched folders at regular intervals.
+    """
+
+    def __init__(self, folders, ignore=None, interval=0.5):
+        self.folders = [str(folder) for folder in folders]
+        self.ignore = ignore or (lambda path: False)
+        self.interval = interval
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        snapshot = {}
+        for folder in self.folders:
+            if os.path.isfile(folder):
+                self.stat_into(snapshot, folder)
+                continue
+            for root, dirs, files in os.walk(folder):
+                dirs[:] = [name for name in dirs
+                           if not self.ignore(os.path.join(root, name))]
+                for name in files:
+                    path = os.path.join(root, name)
+                    if not self.ignore(path):
+                        self.stat_into(snapshot, path)
+        return snapshot
+
+    @staticmethod
+    def stat_into(snapshot, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        snapshot[path] = (stat.st_mtime, stat.st_size)
+
+    def read_changes(self, timeout):
+        """
+        Waits up to `timeout` seconds and returns a tuple containing the
+        sets of modified, created and deleted paths.
+        """
+        time.sleep(min(timeout, self.interval))
+        snapshot = self.take_snapshot()
+        old = self.snapshot
+        self.snapshot = snapshot
+        created = set(snapshot) - set(old)
+        deleted = set(old) - set(snapshot)
+        modified = set(path for path in snapshot
+                       if path in old and snapshot[path] != old[path])
+        return modified, created, deleted
+
+    def close(self):
+        pass
+
+
+class InotifyObserver(object):
+
+    """
+    Detects changes with the Linux inotify API.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0x00000800
+    IN_CLOEXEC = 0x00080000
+
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+            IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+            IN_MOVE_SELF)
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, folders, ignore=None):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                                use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.ignore = ignore or (lambda path: False)
+        self.paths = {}
+        self.files = set()
+        self.file_folders = set()
+        for folder in folders:
+            folder = str(folder)
+            if os.path.isfile(folder):
+                self.files.add(folder)
+                self.file_folders.add(os.path.dirname(folder))
+            else:
+                self.add_tree(folder)
+        for folder in self.file_folders:
+            self.add_watch(folder)
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(
+            self.fd, path.encode(sys.getfilesystemencoding()),
+            ctypes.c_uint32(self.MASK))
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(error, '%s: %s' % (os.strerror(error), path))
+        self.paths[wd] = path
+
+    def add_tree(self, folder):
+        """
+        Watches the given folder and its subfolders. Returns the files
+        that are found in them.
+        """
+        found = set()
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = [name for name in dirs
+                       if not self.ignore(os.path.join(root, name))]
+            self.add_watch(root)
+            found.update(os.path.join(root, name) for name in files)
+        return found
+
+    def is_watched(self, path):
+        """
+        Checks if the given path is of interest. The folders of the
+        individually watched files report changes for all their files.
+        """
+        if path in self.files:
+            return True
+        if self.ignore(path):
+            return False
+        return os.path.dirname(path) not in self.file_folders
+
+    def read_changes(self, timeout):
+        """
+        Waits up to `timeout` seconds and returns a tuple containing the
+        sets of modified, created and deleted paths.
+        """
+        modified, created, deleted = set(), set(), set()
+        readable = select.select([self.fd], [], [], timeout)[0]
+        if not readable:
+            return modified, created, deleted
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError as error:
+            if error.errno == errno.EAGAIN:
+                return modified, created, deleted
+            raise
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                logger.warning("Too many changes. Some were missed.")
+                continue
+            root = self.paths.get(wd)
+            if root is None:
+                continue
+            if mask & self.IN_IGNORED:
+                del self.paths[wd]
+                continue
+            path = os.path.join(
+                root, name.decode(sys.getfilesystemencoding())) \
+                if name else root
+            if not self.is_watched(path):
+                continue
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    created.update(self.add_tree(path))
+                elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    deleted.add(path)
+            elif mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                created.add(path)
+            elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                deleted.add(path)
+            elif mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                deleted.add(path)
+            else:
+                modified.add(path)
+        return modified, created, deleted
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class Watcher(object):
+
+    """
+    Keeps the site, the generator and the template environment loaded
+    and regenerates the resources affected by the changes to the
+    content, the layouts and the configuration files.
+    """
+
+    def __init__(self, site, generator, poll=False, interval=0.5,
+                 debounce=0.05):
+        self.site = site
+        self.generator = generator
+        self.poll = poll
+        self.interval = interval
+        self.debounce = debounce
+        self.observer = None
+
+    def ignored(self, path):
+        """
+        Checks if the given path matches the ignore patterns of the site
+        or lives in the deploy folder.
+        """
+        deploy = str(self.site.config.deploy_root_path)
+        if path == deploy or path.startswith(deploy.rstrip(os.sep) + os.sep):
+            return True
+        name = os.path.basename(path)
+        return name.startswith('.hyde_deps') or \
+            glob_matcher(self.site.config.ignore)(name)
+
+    def watched_paths(self):
+        config = self.site.config
+        paths = [config.content_root_path, config.layout_root_path]
+        paths.extend(config.config_files)
+        return [str(path) for path in paths
+                if File(str(path)).exists or Folder(str(path)).exists]
+
+    def start(self):
+        """
+        Generates the site and starts observing the file system.
+        """
+        self.observe()
+        self.generator.generate_all(incremental=True)
+
+    def observe(self):
+        """
+        Starts observing the file system.
+        """
+        paths = self.watched_paths()
+        if not self.poll:
+            try:
+                self.observer = InotifyObserver(paths, self.ignored)
+            except (OSError, AttributeError) as error:
+                logger.info("Cannot use inotify [%s]. "
+                            "Polling for changes instead." % error)
+        if not self.observer:
+            self.observer = PollingObserver(paths, self.ignored,
+                                            self.interval)
+
+    def stop(self):
+        if self.observer:
+            self.observer.close()
+            self.observer = None
+
+    def wait_for_changes(self, timeout=None):
+        """
+        Waits for a change and collects the changes that follow within
+        the debounce interval. Returns a tuple containing the sets of
+        modified, created and deleted paths.
+        """
+        modified, created, deleted = set(), set(), set()
+        deadline = None if timeout is None else time.time() + timeout
+        while not (modified or created or deleted):
+            wait = self.interval
+            if deadline is not None:
+                wait = deadline - time.time()
+                if wait <= 0:
+                    break
+            changes = self.observer.read_changes(wait)
+            modified.update(changes[0])
+            created.update(changes[1])
+            deleted.update(changes[2])
+        while modified or created or deleted:
+            changes = self.observer.read_changes(self.debounce)
+            if not any(changes):
+                break
+            modified.update(changes[0])
+            created.update(changes[1])
+            deleted.update(changes[2])
+        modified -= created | deleted
+        return modified, created, deleted
+
+    def process(self, modified, created, deleted):
+        """
+        Regenerates the site based on the given changes. Added and removed
+        files update the loaded site model in place. The new resources and
+        the resources affected by the changes are generated.
+        """
+        deleted = set(path for path in deleted if not os.path.exists(path))
+        changed = modified | created | deleted
+        logger.info("Changed: %s" % ', '.join(sorted(changed)))
+        self.generator.apply_changes(created, deleted, modified)
+
+    def run_once(self, timeout=None):
+        """
+        Waits for the next set of changes and processes them. Returns
+        True if there were any changes.
+        """
+        changes = self.wait_for_changes(timeout)
+        if not any(changes):
+            return False
+        start = time.time()
+        try:
+            self.process(*changes)
+        except Exception as exception:
+            logger.error("Error occured when regenerating the site [%s]"
+                         % repr(exception))
+            import traceback
+            logger.debug(traceback.format_exc())
+        else:
+            logger.info("Regenerated in %.3f seconds" % (time.time() - start))
+        return True
+
+    def watch(self):
+        """
+        Regenerates the site whenever it changes until interrupted.
+        """
+        self.start()
+        try:
+            while True:
+                self.run_once()
+        finally:
+            self.stop()
@@ -9,6 +9,7 @@ from hyde.site import Site
 
 from fswrap import File, Folder
 from pyquery import PyQuery
+import re
 import yaml
 
 
@@ -116,6 +117,53 @@ twitter: %(twitter)s
         for k, v in d.items():
             assert v in q("span." + k).text()
 
+    def test_reads_front_matter_lazily(self):
+        about2 = File(TEST_SITE.child('content/about2.html'))
+        about2.write("---\ntitle: About\n---\n" + "body\n" * 1000)
+        s = Site(TEST_SITE)
+        s.config.plugins = ['hyde.ext.plugins.meta.MetaPlugin']
+        gen = Generator(s)
+        s.load()
+        gen.events.begin_site()
+        res = s.content.resource_from_path(about2.path)
+        assert 'meta' not in res.__dict__
+        assert res.meta.title == 'About'
+        assert 'meta' in res.__dict__
+        plugin = s.plugins[0]
+        assert plugin.__read_header__(about2.path) == \
+            "---\ntitle: About\n---\n"
+
+    def test_front_matter_matches_full_text(self):
+        texts = {
+            'a.html': "---\ntitle: A\n---\nbody\n---\nnot: meta\n---\n",
+            'b.html': "\n\n===\ntitle: B\ntags: [x, y]\n===\nbody",
+            'c.html': "no meta\n---\ntitle: C\n---\n",
+            'd.html': "---\ntitle: D\n  ---\nbody",
+            'e.html': "---\ntitle: E\n---",
+            'f.html': "---\n---\ntitle: F\n---\nbody",
+        }
+        for name, text in texts.items():
+            File(TEST_SITE.child('content/' + name)).write(text)
+        s = Site(TEST_SITE)
+        s.config.plugins = ['hyde.ext.plugins.meta.MetaPlugin']
+        gen = Generator(s)
+        s.load()
+        gen.events.begin_site()
+        plugin = s.plugins[0]
+        for res in s.content.walk_resources():
+            if not res.source_file.is_text:
+                continue
+            match = re.match(plugin.yaml_finder, res.source_file.read_all())
+            expected = yaml.load(match.group(1)) if match else {}
+            header = plugin.__read_header__(res.path)
+            assert plugin.__parse_front_matter__(res, header)[1] == expected
+        content = s.content
+        assert content.resource_from_relative_path('a.html').meta.title == 'A'
+        assert content.resource_from_relative_path('b.html').meta.tags == \
+            ['x', 'y']
+        assert not hasattr(
+            content.resource_from_relative_path('c.html').meta, 'title')
+
     def test_can_load_from_node_meta(self):
         d = {'title': 'A nice title',
              'author': 'Lakshmi Vyas',
@@ -5,10 +5,14 @@ Use nose
 `$ nosetests`
 """
 
+from hyde.ext.plugins.meta import MetaPlugin
 from hyde.generator import Generator
 from hyde.model import Config
+from hyde.plugin import Plugin
+from hyde.profiler import Profiler
 from hyde.site import Site
 
+from mock import patch
 from pyquery import PyQuery
 
 from fswrap import File, Folder
@@ -16,6 +20,38 @@ from fswrap import File, Folder
 TEST_SITE = File(__file__).parent.child_folder('_test')
 
 
+class NodeEventsPlugin(Plugin):
+
+    def __init__(self, site):
+        super(NodeEventsPlugin, self).__init__(site)
+        self.events = []
+
+    def begin_node(self, node):
+        self.events.append(('begin', node.relative_path))
+
+    def node_complete(self, node):
+        self.events.append(('complete', node.relative_path))
+
+
+class CreatedDatePlugin(Plugin):
+
+    def begin_site(self):
+        for resource in self.site.content.walk_resources():
+            resource.meta.created = 'set by the plugin'
+
+
+class ResourceStatePlugin(Plugin):
+
+    parallel_safe = False
+
+    def __init__(self, site):
+        super(ResourceStatePlugin, self).__init__(site)
+        self.seen = []
+
+    def begin_text_resource(self, resource, text):
+        self.seen.append(resource.relative_path)
+
+
 class TestGenerator(object):
 
     def setUp(self):
@@ -84,19 +120,333 @@ class TestGenerator(object):
             TEST_SITE.child('content/about.html'))
         gen = Generator(site)
         gen.generate_all()
-        import time
-        time.sleep(1)
         assert not gen.has_resource_changed(resource)
         text = resource.source_file.read_all()
-        resource.source_file.write(text)
+        resource.source_file.write(text + '\n')
         assert gen.has_resource_changed(resource)
         gen.generate_all()
         assert not gen.has_resource_changed(resource)
+        l = File(TEST_SITE.child('layout/root.html'))
+        l.write(l.read_all() + '\n')
+        assert gen.has_resource_changed(resource)
+
+    def test_has_resource_changed_ignores_touched_files(self):
+        site = Site(TEST_SITE)
+        site.load()
+        resource = site.content.resource_from_path(
+            TEST_SITE.child('content/about.html'))
+        gen = Generator(site)
+        gen.generate_all()
+        import time
         time.sleep(1)
+        resource.source_file.write(resource.source_file.read_all())
         l = File(TEST_SITE.child('layout/root.html'))
         l.write(l.read_all())
+        assert not gen.has_resource_changed(resource)
+        site.config.base_url = '/other'
+        gen.config_digest = None
         assert gen.has_resource_changed(resource)
 
+    def test_config_digest_ignores_key_order(self):
+        def digest(settings):
+            site = Site(TEST_SITE, Config(TEST_SITE, config_dict=dict(
+                settings)))
+            return Generator(site).get_config_digest()
+
+        settings = [('base_url', '/blog'), ('media_url', '/media'),
+                    ('tags', dict(a=1, b=2, c=3))]
+        assert digest(settings) == digest(reversed(settings))
+
+    def test_incremental_generation_skips_unchanged_resources(self):
+        site = Site(TEST_SITE)
+        site.load()
+        gen = Generator(site)
+        gen.generate_all()
+        gen.manifest.save()
+        resources = [res for res in site.content.walk_resources()
+                     if res.is_processable]
+        assert gen.stats['generated'] == len(resources)
+
+        site = Site(TEST_SITE)
+        site.load()
+        gen = Generator(site)
+        gen.generate_all(incremental=True)
+        assert gen.stats['generated'] == 0
+        assert gen.stats['skipped'] == len(resources)
+
+        about = File(TEST_SITE.child('content/about.html'))
+        about.write(about.read_all() + '\n')
+        gen.generate_all(incremental=True)
+        assert gen.stats['generated'] == 1
+        assert gen.stats['skipped'] == len(resources) - 1
+
+    def test_affected_by(self):
+        site = Site(TEST_SITE)
+        site.load()
+        gen = Generator(site)
+        gen.generate_all()
+        gen.deps.save()
+
+        site = Site(TEST_SITE)
+        site.load()
+        gen = Generator(site)
+        about = site.content.resource_from_relative_path('about.html')
+        post = site.content.resource_from_relative_path(
+            'blog/2010/december/merry-christmas.html')
+        assert gen.affected_by(
+            [TEST_SITE.child('layout/blog/post.html')]) == set([post])
+        assert gen.affected_by(['base.html']) == set([about, post])
+        assert gen.affected_by([about.path]) == set([about])
+        assert gen.affected_by(
+            [TEST_SITE.child('site.yaml')]) == set(
+                site.content.walk_resources())
+
+    def test_generate_affected(self):
+        site = Site(TEST_SITE)
+        site.load()
+        gen = Generator(site)
+        gen.generate_all()
+        gen.generate_affected([TEST_SITE.child('layout/blog/post.html')])
+        assert gen.stats['generated'] == 1
+
+    def test_apply_changes(self):
+        site = Site(TEST_SITE, Config(TEST_SITE, config_dict={
+            'plugins': ['hyde.ext.plugins.meta.MetaPlugin']}))
+        site.load()
+        gen = Generator(site)
+        gen.generate_all()
+        deploy = Folder(site.config.deploy_root_path)
+        content = site.content.source_folder
+        folder = content.child_folder('blog/2011')
+        folder.make()
+        File(folder.child('new.html')).write(
+            '---\ntitle: New\n---\n{% extends "base.html" %}'
+            '{% block main %}{{ resource.meta.title }}{% endblock %}')
+        about = File(content.child('about.html'))
+        about.delete()
+        added, removed = gen.apply_changes(created=[folder.path],
+                                           deleted=[about.path])
+        assert [res.relative_path for res in added] == ['blog/2011/new.html']
+        assert [res.relative_path for res in removed] == ['about.html']
+        assert gen.stats['generated'] == 1
+        assert 'New' in File(deploy.child('blog/2011/new.html')).read_all()
+        assert not File(deploy.child('about.html')).exists
+        assert 'about.html' not in gen.manifest
+        assert not site.content.resource_from_relative_path('about.html')
+
+    def test_reads_sources_once(self):
+        site = Site(TEST_SITE, Config(TEST_SITE, config_dict={
+            'plugins': ['hyde.ext.plugins.meta.MetaPlugin']}))
+        site.load()
+        gen = Generator(site)
+        gen.generate_all()
+        text_resources = [res for res in site.content.walk_resources()
+                          if res.source_file.is_text]
+        assert site.source_cache.misses == len(text_resources)
+        assert site.source_cache.hits
+
+    def _load_with_meta(self, plugins=None):
+        site = Site(TEST_SITE, Config(TEST_SITE, config_dict={
+            'plugins': plugins or ['hyde.ext.plugins.meta.MetaPlugin']}))
+        gen = Generator(site)
+        reads = []
+        original = MetaPlugin.__read_header__
+
+        def read_header(plugin, path):
+            reads.append(File(path).get_relative_path(
+                site.content.source_folder))
+            return original(plugin, path)
+
+        with patch.object(MetaPlugin, '__read_header__', read_header):
+            site.load()
+            gen.events.begin_site()
+            meta = dict((res.relative_path, res.meta.to_dict())
+                        for res in site.content.walk_resources())
+        return gen, meta, reads
+
+    def test_snapshot_skips_unchanged_metadata(self):
+        gen, expected, first_reads = self._load_with_meta()
+        assert first_reads
+        gen.finalize()
+        gen, meta, reads = self._load_with_meta()
+        assert not reads
+        assert meta == expected
+
+        about = File(TEST_SITE.child('content/about.html'))
+        about.write('---\ntitle: About\n---\n' + about.read_all())
+        gen, meta, reads = self._load_with_meta()
+        assert reads == ['about.html']
+        assert meta['about.html']['title'] == 'About'
+        gen.finalize()
+        gen, meta, reads = self._load_with_meta()
+        assert not reads
+        assert meta['about.html']['title'] == 'About'
+
+        gen, meta, reads = self._load_with_meta(
+            ['hyde.ext.plugins.meta.MetaPlugin',
+             'hyde.ext.plugins.meta.AutoExtendPlugin'])
+        assert sorted(reads) == sorted(first_reads)
+
+    def test_snapshot_key_does_not_wait_for_plugins(self):
+        def key(plugins):
+            site = Site(TEST_SITE, Config(TEST_SITE, config_dict=dict(
+                plugins=plugins)))
+            site.load()
+            before = site.snapshot.key
+            Generator(site)
+            assert site.open_snapshot().key == before
+            return before
+
+        meta = ['hyde.ext.plugins.meta.MetaPlugin']
+        assert key(meta) == key(list(meta))
+        assert key(meta) != key([])
+
+    def test_low_memory_skips_the_snapshot(self):
+        site = Site(TEST_SITE)
+        site.config.low_memory = True
+        site.load()
+        assert site.snapshot is None
+        Generator(site).generate_all()
+        assert not File(TEST_SITE.child('.hyde_snapshot')).exists
+
+    def test_write_if_changed(self):
+        post = File(TEST_SITE.child(
+            'content/blog/2010/december/merry-christmas.html'))
+        post.write(post.read_all().replace('lipsum()', 'resource.name'))
+        site = Site(TEST_SITE)
+        site.config.write_if_changed = True
+        site.load()
+        gen = Generator(site)
+        gen.generate_all()
+        resources = [res for res in site.content.walk_resources()
+                     if res.is_processable]
+        assert gen.stats['written'] == len(resources)
+        deploy = Folder(site.config.deploy_root_path)
+        about = File(deploy.child('about.html'))
+        favicon = File(deploy.child('favicon.ico'))
+        about_time = about.last_modified
+        favicon_time = favicon.last_modified
+
+        import time
+        time.sleep(1)
+        gen.generate_all()
+        assert gen.stats['generated'] == len(resources)
+        assert gen.stats['written'] == 0
+        assert about.last_modified == about_time
+        assert favicon.last_modified == favicon_time
+
+        source = File(TEST_SITE.child('content/about.html'))
+        source.write(source.read_all().replace(
+            '{% block main %}', '{% block main %}Changed'))
+        gen.generate_all()
+        assert gen.stats['written'] == 1
+        assert about.last_modified > about_time
+
+    def test_generate_all_in_parallel(self):
+        post = File(TEST_SITE.child(
+            'content/blog/2010/december/merry-christmas.html'))
+        post.write(post.read_all().replace('lipsum()', 'resource.name'))
+
+        def read_deploy(deploy):
+            contents = {}
+            with deploy.walker as walker:
+                @walker.file_visitor
+                def visit_file(afile):
+                    with open(afile.path, 'rb') as f:
+                        contents[afile.get_relative_path(deploy)] = f.read()
+            return contents
+
+        site = Site(TEST_SITE)
+        site.load()
+        gen = Generator(site)
+        gen.generate_all()
+        deploy = site.config.deploy_root_path
+        expected = read_deploy(deploy)
+        deploy.delete()
+
+        site = Site(TEST_SITE)
+        site.load()
+        gen = Generator(site, jobs=3)
+        gen.generate_all()
+        assert expected
+        assert read_deploy(deploy) == expected
+        assert 'about.html' in gen.deps
+
+    def test_parallel_generation_keeps_node_event_order(self):
+        def generate(jobs):
+            site = Site(TEST_SITE, Config(TEST_SITE, config_dict={
+                'plugins': ['test_generate.NodeEventsPlugin']}))
+            site.load()
+            gen = Generator(site, jobs=jobs)
+            gen.generate_all()
+            return site.plugins[0].events
+
+        expected = generate(1)
+        assert expected
+        assert generate(3) == expected
+
+    def test_parallel_generation_with_unsafe_plugin(self):
+        site = Site(TEST_SITE, Config(TEST_SITE, config_dict={
+            'plugins': ['test_generate.ResourceStatePlugin']}))
+        site.load()
+        gen = Generator(site, jobs=3)
+        with patch('hyde.generator.logger') as logger:
+            gen.generate_all()
+        assert logger.warning.called
+        assert 'about.html' in site.plugins[0].seen
+
+    def test_generate_all_with_low_memory(self):
+        def generate(low_memory):
+            site = Site(TEST_SITE, Config(TEST_SITE, config_dict={
+                'plugins': ['hyde.ext.plugins.meta.MetaPlugin',
+                            'test_generate.CreatedDatePlugin'],
+                'low_memory': low_memory}))
+            site.load()
+            gen = Generator(site)
+            gen.generate_all()
+            deploy = Folder(site.config.deploy_root_path)
+            about = File(deploy.child('about.html')).read_all()
+            deploy.delete()
+            return site, gen, about
+
+        site, gen, expected = generate(False)
+        assert site.source_cache.entries
+        site, gen, about = generate(True)
+        assert about == expected
+        assert not site.source_cache.entries
+        assert not any(res.path in gen.digests
+                       for res in site.content.walk_resources())
+        for resource in site.content.walk_resources():
+            assert resource.meta.created == 'set by the plugin'
+        assert 'about.html' in gen.deps
+
+    def test_profile(self):
+        site = Site(TEST_SITE, Config(TEST_SITE, config_dict={
+            'plugins': ['hyde.ext.plugins.meta.MetaPlugin']}))
+        site.load()
+        for jobs in (1, 2):
+            profiler = Profiler()
+            gen = Generator(site, jobs=jobs, profiler=profiler)
+            gen.generate_all()
+            profile = profiler.to_dict()
+            resources = dict((item['path'], item)
+                             for item in profile['resources'])
+            assert 'render' in resources['about.html']
+            assert 'write' in resources['about.html']
+            assert 'copy' in resources['favicon.ico']
+            totals = [item['total'] for item in profile['resources']]
+            assert totals == sorted(totals, reverse=True)
+            hooks = dict(((item['plugin'], item['hook']), item)
+                         for item in profile['plugin_hooks'])
+            assert hooks[('MetaPlugin', 'begin_site')]['calls'] == 1
+            assert hooks[('MetaPlugin', 'begin_text_resource')]['calls']
+            assert profile['plugins'][0]['name'] == 'MetaPlugin'
+
+        report = TEST_SITE.child('profile.json')
+        profiler.save(report)
+        assert 'MetaPlugin' in File(TEST_SITE.child('profile.txt')).read_all()
+        assert 'about.html' in File(report).read_all()
+
     def test_context(self):
         site = Site(TEST_SITE, Config(TEST_SITE, config_dict={
             "context": {
@@ -7,6 +7,7 @@ Use nose
 Some code borrowed from rwbench.py from the jinja2 examples
 """
 from datetime import datetime
+import os
 from random import choice, randrange
 
 from hyde._compat import PY3
@@ -173,6 +174,29 @@ def test_markdown():
     assert html == u'<h3>Heading 3</h3>'
 
 
+def test_markdown_filter_reuses_converter():
+    t = Jinja2Template(JINJA2.path)
+    t.configure(None)
+    source = "{{ text|markdown }}"
+    html = t.render(source, dict(text='[link][a]\n\n[a]: http://a.com'))
+    assert html == u'<p><a href="http://a.com">link</a></p>'
+    # References found earlier must not leak into later conversions.
+    assert t.render(source, dict(text='[link][a]')) == u'<p>[link][a]</p>'
+    assert t.render(source, dict(text='[link][a]')) == u'<p>[link][a]</p>'
+    assert t.cache_stats() == dict(markdown=(1, 2))
+
+
+def test_syntax_reuses_highlighted_code():
+    t = Jinja2Template(JINJA2.path)
+    t.configure(None)
+    source = "{% syntax python %}def add(a, b): return a + b{% endsyntax %}"
+    html = t.render(source, {})
+    assert 'class="highlight"' in html
+    assert '<figcaption>Python</figcaption>' in html
+    assert t.render(source, {}) == html
+    assert t.cache_stats() == dict(syntax=(1, 1))
+
+
 def test_restructuredtext():
     source = """
 {% restructuredtext %}
@@ -387,6 +411,190 @@ class TestJinjaTemplate(object):
         assert 'layout.html' in deps
         assert 'index.html' in deps
 
+    def test_depends_parses_shared_templates_once(self):
+        site = Site(TEST_SITE)
+        JINJA2.copy_contents_to(site.content.source)
+        File(TEST_SITE.child('content/inc.md')).write(
+            "{% extends 'index.html' %}")
+        File(TEST_SITE.child('content/other.md')).write(
+            "{% extends 'index.html' %}{% include 'helpers.html' %}")
+        site.load()
+        gen = Generator(site)
+        gen.load_template_if_needed()
+        t = gen.template
+        parsed = []
+        parse = t.env.parse
+
+        def counting_parse(source, *args, **kwargs):
+            parsed.append(source)
+            return parse(source, *args, **kwargs)
+
+        t.env.parse = counting_parse
+        assert sorted(t.get_dependencies('inc.md')) == [
+            'helpers.html', 'index.html', 'layout.html']
+        assert sorted(t.get_dependencies('other.md')) == [
+            'helpers.html', 'index.html', 'layout.html']
+        assert len(parsed) == 5
+        t.get_dependencies('other.md')
+        assert len(parsed) == 5
+
+        index = File(TEST_SITE.child('content/index.html'))
+        index.write(index.read_all().replace(
+            "{% extends", "{% include 'inc.md' %}{% extends"))
+        assert 'inc.md' not in t.get_dependencies('other.md')
+        assert len(parsed) == 5
+        # The references are checked again in the next generation.
+        t.clear_caches()
+        assert 'inc.md' in t.get_dependencies('other.md')
+
+    def test_bytecode_cache_survives_builds(self):
+        def generate():
+            site = Site(TEST_SITE)
+            site.load()
+            gen = Generator(site)
+            gen.generate_all()
+            return gen.template.cache_stats()['bytecode']
+
+        hits, misses = generate()
+        assert misses
+        cache = TEST_SITE.child_folder('.hyde_bytecode')
+        assert cache.exists
+        assert generate() == (hits + misses, 0)
+
+        def entries():
+            return sorted(os.listdir(cache.path))
+
+        stored = entries()
+        about = File(TEST_SITE.child('content/about.html'))
+        for _ in range(3):
+            about.write(about.read_all() + '\n')
+            assert generate() == (hits + misses - 1, 1)
+        assert entries() == stored
+
+        with cache.walker as walker:
+            @walker.file_visitor
+            def damage(afile):
+                afile.write('damaged')
+        assert generate() == (0, hits + misses)
+
+    def test_cache_tag_renders_fragment_once(self):
+        site = Site(TEST_SITE)
+        site.load()
+        gen = Generator(site)
+        gen.load_template_if_needed()
+        template = gen.template
+        calls = []
+
+        def render_count():
+            calls.append(1)
+            return len(calls)
+        template.env.globals['render_count'] = render_count
+        text = ("{% cache 'list', resource.node %}"
+                "{{ render_count() }}{% endcache %}")
+        about = site.content.resource_from_relative_path('about.html')
+        post = site.content.resource_from_relative_path(
+            'blog/2010/december/merry-christmas.html')
+        assert template.render(text, dict(resource=about)) == '1'
+        assert template.render(text, dict(resource=about)) == '1'
+        assert template.render(text, dict(resource=post)) == '2'
+        assert template.cache_stats()['fragment'] == (1, 2)
+        template.clear_caches()
+        assert template.render(text, dict(resource=about)) == '3'
+
+    def test_fragment_cache_survives_builds(self):
+        site_yaml = File(TEST_SITE.child('site.yaml'))
+        site_yaml.write(site_yaml.read_all() +
+                        '\nfragment_cache: .hyde_fragments\n')
+        File(TEST_SITE.child('layout/list.html')).write(
+            "{% cache 'posts', resource.node %}{% include 'inc.html' %}"
+            "{% for post in resource.node.walk_resources() %}"
+            "{{ post.name }} {% endfor %}{% endcache %}")
+        inc = File(TEST_SITE.child('layout/inc.html'))
+        inc.write('Posts: ')
+        folder = TEST_SITE.child_folder('content/blog/2010/december')
+        for name in ('first.html', 'second.html'):
+            File(folder.child(name)).write("{% extends 'list.html' %}")
+
+        def generate():
+            site = Site(TEST_SITE)
+            site.load()
+            gen = Generator(site)
+            gen.generate_all()
+            return gen.template.cache_stats()['fragment']
+
+        assert generate() == (1, 1)
+        assert TEST_SITE.child_folder('.hyde_fragments').exists
+        assert generate() == (2, 0)
+        deploy = TEST_SITE.child_folder('deploy/blog/2010/december')
+        assert File(deploy.child('first.html')).read_all().startswith(
+            'Posts: first.html merry-christmas.html second.html')
+
+        inc.write('All posts: ')
+        assert generate() == (1, 1)
+        assert File(deploy.child('second.html')).read_all().startswith(
+            'All posts: ')
+
+        post = File(folder.child('merry-christmas.html'))
+        post.write(post.read_all() + '\n')
+        assert generate() == (1, 1)
+        assert generate() == (2, 0)
+
+    def test_fragment_cache_checks_resources_read_by_the_fragment(self):
+        site_yaml = File(TEST_SITE.child('site.yaml'))
+        site_yaml.write(site_yaml.read_all() +
+                        '\nfragment_cache: .hyde_fragments\n'
+                        'plugins:\n    - hyde.ext.plugins.meta.MetaPlugin\n')
+        File(TEST_SITE.child('layout/titles.html')).write(
+            "{% cache 'titles' %}{% for r in site.content.walk_resources() %}"
+            "{% if r.meta.title %}[{{ r.meta.title }}]{% endif %}"
+            "{% endfor %}{% endcache %}")
+        folder = TEST_SITE.child_folder('content/posts')
+        folder.make()
+        post = File(folder.child('one.html'))
+        post.write("---\ntitle: One\n---\n{% extends 'titles.html' %}")
+
+        def generate():
+            site = Site(TEST_SITE)
+            site.load()
+            gen = Generator(site)
+            gen.generate_all()
+            text = File(TEST_SITE.child('deploy/posts/one.html')).read_all()
+            return text, gen.template.cache_stats()['fragment']
+
+        assert generate() == ('[One]', (0, 1))
+        assert generate() == ('[One]', (1, 0))
+        post.write(post.read_all().replace('One', 'Two'))
+        assert generate() == ('[Two]', (0, 1))
+        File(folder.child('three.html')).write(
+            "---\ntitle: Three\n---\n{% extends 'titles.html' %}")
+        text, stats = generate()
+        assert text == '[Three][Two]' or text == '[Two][Three]'
+        assert stats == (1, 1)
+
+    def test_render_cache_survives_builds(self):
+        site = Site(TEST_SITE)
+        site.config = Config(TEST_SITE, config_dict=dict(
+            render_cache='.hyde_render'))
+        source = "{% markdown %}*Cached*{% endmarkdown %}"
+        for stats in ((0, 1), (1, 0)):
+            t = Jinja2Template(TEST_SITE.path)
+            t.configure(site)
+            assert t.render(source, {}) == u'<p><em>Cached</em></p>'
+            assert t.cache_stats()['markdown'] == stats
+        assert TEST_SITE.child_folder('.hyde_render').exists
+
+    def test_depends_with_cycles(self):
+        site = Site(TEST_SITE)
+        File(TEST_SITE.child('content/a.html')).write(
+            "{% include 'b.html' %}")
+        File(TEST_SITE.child('content/b.html')).write(
+            "{% include 'a.html' %}")
+        site.load()
+        gen = Generator(site)
+        gen.load_template_if_needed()
+        assert sorted(gen.template.get_dependencies('a.html')) == [
+            'a.html', 'b.html']
+
     def test_line_statements_with_blocks(self):
         site = Site(TEST_SITE)
         JINJA2.copy_contents_to(site.content.source)
@@ -625,6 +833,77 @@ Hyde & Jinja.
         assert "mark" not in html
         assert "reference" not in html
 
+    def test_refer_renders_referred_template_once(self):
+        inc = File(TEST_SITE.child('content/inc.md'))
+        inc.write("{% mark count %}{{ render_count() }}{% endmark %}")
+        site = Site(TEST_SITE)
+        site.config.refer_cache = True
+        site.load()
+        gen = Generator(site)
+        gen.load_template_if_needed()
+        template = gen.template
+        calls = []
+
+        def render_count():
+            calls.append(1)
+            return len(calls)
+        template.env.globals['render_count'] = render_count
+        text = '{% refer to "inc.md" as inc %}{{ inc.count }} {{ inc.html }}'
+        assert template.render(text, {}) == '1 1'
+        assert template.render(text, {}) == '1 1'
+        assert template.cache_stats()['refer'] == (1, 1)
+
+        def no_dependencies(path):
+            raise AssertionError("The references of %s were read" % path)
+        template.clear_caches()
+        template.get_dependencies = no_dependencies
+        assert template.render(text, {}) == '1 1'
+        del template.get_dependencies
+        inc.write("{% mark count %}{{ render_count() }}!{% endmark %}")
+        template.clear_caches()
+        assert template.render(text, {}) == '2! 2!'
+        assert template.cache_stats()['refer'] == (0, 1)
+
+        template.release_resource(
+            site.content.resource_from_relative_path('inc.md'))
+        assert template.render(text, {}) == '3! 3!'
+
+    def test_refer_cache_evicts_least_recently_used(self):
+        for name in ('a.md', 'b.md', 'c.md'):
+            File(TEST_SITE.child('content/' + name)).write(
+                "{%% mark text %%}%s{%% endmark %%}" % ('x' * 100))
+        site = Site(TEST_SITE)
+        site.config.refer_cache = True
+        site.load()
+        gen = Generator(site)
+        gen.load_template_if_needed()
+        template = gen.template
+        cache = template.env.reference_cache
+        cache.max_size = 450
+
+        def refer(name):
+            template.render('{%% refer to "%s" as ref %%}{{ ref.text }}'
+                            % name, {})
+        for name in ('a.md', 'b.md', 'a.md', 'c.md'):
+            refer(name)
+        assert list(cache.entries) == ['a.md', 'c.md']
+        assert cache.size <= cache.max_size
+
+    def test_refer_uses_the_context_of_every_page(self):
+        File(TEST_SITE.child('content/inc.md')).write(
+            "{% mark greeting %}Hello {{ who }}{% endmark %}")
+        for who in ('a', 'b'):
+            File(TEST_SITE.child('content/%s.html' % who)).write(
+                "{%% set who = '%s' %%}{%% refer to 'inc.md' as inc %%}"
+                "{{ inc.greeting }}" % who.upper())
+        site = Site(TEST_SITE)
+        site.load()
+        gen = Generator(site)
+        gen.generate_all()
+        deploy = TEST_SITE.child_folder('deploy')
+        assert File(deploy.child('a.html')).read_all() == 'Hello A'
+        assert File(deploy.child('b.html')).read_all() == 'Hello B'
+
     def test_refer_with_var(self):
         text = """
 ===
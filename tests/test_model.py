@@ -4,7 +4,9 @@ Use nose
 `$ pip install nose`
 `$ nosetests`
 """
-from hyde.model import Config, Expando
+import os
+
+from hyde.model import Config, Dependents, Expando, Manifest, Snapshot
 
 from fswrap import File, Folder
 
@@ -168,3 +170,175 @@ class TestConfig(object):
         assert c.media_root_path == c.content_root_path.child_folder('xxx')
         assert c.media_url == TEST_SITE.child_folder('/media')
         assert c.deploy_root_path == Folder('~/deploy_site')
+
+
+class TestDependents(object):
+
+    def setUp(self):
+        TEST_SITE.make()
+
+    def tearDown(self):
+        TEST_SITE.delete()
+
+    def test_saves_and_loads_dependencies(self):
+        deps = Dependents(TEST_SITE)
+        deps['a.html'] = ['base.j2']
+        deps['b.html'] = []
+        deps['b.html'].extend(['a.html', 'base.j2'])
+        deps.save()
+        deps = Dependents(TEST_SITE)
+        assert 'a.html' in deps
+        assert 'c.html' not in deps
+        assert deps['a.html'] == ['base.j2']
+        assert deps['b.html'] == ['a.html', 'base.j2']
+        assert sorted(deps) == ['a.html', 'b.html']
+
+    def test_saves_only_changed_entries(self):
+        deps = Dependents(TEST_SITE)
+        deps['a.html'] = ['base.j2']
+        deps['b.html'] = ['base.j2']
+        deps.save()
+        deps = Dependents(TEST_SITE)
+        deps['b.html'].append('macros.j2')
+        del deps['a.html']
+        deps.save()
+        deps = Dependents(TEST_SITE)
+        assert dict(deps.items()) == {'b.html': ['base.j2', 'macros.j2']}
+
+    def test_missing_entries_do_not_load_the_graph(self):
+        deps = Dependents(TEST_SITE)
+        for index in range(20):
+            deps['%d.html' % index] = ['base.j2']
+        deps.save()
+        deps = Dependents(TEST_SITE)
+        assert 'missing.html' not in deps
+        assert deps.get('missing.html') is None
+        assert not deps.cache
+        assert deps['1.html'] == ['base.j2']
+        deps.release(max_entries=1)
+        assert not deps.cache
+
+    def test_migrates_yaml_dependencies(self):
+        File(TEST_SITE.child('.hyde_deps')).write(
+            yaml.dump({'a.html': ['base.j2']}))
+        deps = Dependents(TEST_SITE)
+        assert deps['a.html'] == ['base.j2']
+        deps.save()
+        assert not File(TEST_SITE.child('.hyde_deps')).exists
+        assert Dependents(TEST_SITE)['a.html'] == ['base.j2']
+
+
+class TestManifest(object):
+
+    def setUp(self):
+        TEST_SITE.make()
+
+    def tearDown(self):
+        TEST_SITE.delete()
+
+    def test_entries_share_equal_values(self):
+        manifest = Manifest(TEST_SITE)
+        for name in ('a.html', 'b.html'):
+            manifest.record(name, name, name.upper(),
+                            {'base.j2': '1' * 40}, '2' * 40)
+        manifest.record('c.html', 'c.html', 'C', {'base.j2': '3'}, '2' * 40)
+
+        def check(manifest):
+            a, b, c = [manifest.get(name)
+                       for name in ('a.html', 'b.html', 'c.html')]
+            assert a['deps'] is b['deps']
+            assert a['deps'] is not c['deps']
+            assert a['config'] is b['config'] is c['config']
+            assert b['source'] == 'B.HTML'
+            assert c['deps'] == {'base.j2': '3'}
+        check(manifest)
+        manifest.save()
+        check(Manifest(TEST_SITE))
+
+
+class TestSnapshot(object):
+
+    def setUp(self):
+        TEST_SITE.make()
+        self.folder = TEST_SITE.child_folder('content')
+        self.folder.make()
+        self.page = File(self.folder.child('page.html'))
+        self.page.write('abc')
+        self.parsed = []
+
+    def tearDown(self):
+        TEST_SITE.delete()
+
+    def parse(self, path):
+        self.parsed.append(path)
+        return File(path).read_all().upper()
+
+    def scan(self, path):
+        self.parsed.append(path)
+        for name in os.listdir(path):
+            yield name, os.path.join(path, name), False
+
+    def test_reuses_values_of_unchanged_files(self):
+        snapshot = Snapshot(TEST_SITE, 'key')
+        assert snapshot.read(self.page.path, 'text', self.parse) == 'ABC'
+        assert snapshot.listing(self.folder.path, self.scan) == [
+            ('page.html', self.page.path, False)]
+        snapshot.save()
+        snapshot = Snapshot(TEST_SITE, 'key')
+        assert snapshot.read(self.page.path, 'text', self.parse) == 'ABC'
+        assert snapshot.listing(self.folder.path, self.scan) == [
+            ('page.html', self.page.path, False)]
+        assert self.parsed == [self.page.path, self.folder.path]
+
+    def test_reads_changed_files_again(self):
+        snapshot = Snapshot(TEST_SITE, 'key')
+        snapshot.read(self.page.path, 'text', self.parse)
+        snapshot.listing(self.folder.path, self.scan)
+        snapshot.save()
+        stat = os.stat(self.page.path)
+        self.page.write('abcd')
+        os.utime(self.page.path, (stat.st_atime, stat.st_mtime + 10))
+        snapshot = Snapshot(TEST_SITE, 'key')
+        assert snapshot.read(self.page.path, 'text', self.parse) == 'ABCD'
+        assert len(self.parsed) == 3
+
+    def test_compares_hashes_when_only_the_time_changed(self):
+        snapshot = Snapshot(TEST_SITE, 'key')
+        snapshot.read(self.page.path, 'text', self.parse)
+        snapshot.listing(self.folder.path, self.scan)
+        snapshot.save()
+        stat = os.stat(self.page.path)
+        os.utime(self.page.path, (stat.st_atime, stat.st_mtime + 10))
+        snapshot = Snapshot(TEST_SITE, 'key')
+        assert snapshot.read(self.page.path, 'text', self.parse) == 'ABC'
+        assert len(self.parsed) == 2
+
+    def test_lists_changed_folders_again(self):
+        snapshot = Snapshot(TEST_SITE, 'key')
+        snapshot.listing(self.folder.path, self.scan)
+        snapshot.save()
+        File(self.folder.child('new.html')).write('new')
+        stat = os.stat(self.folder.path)
+        os.utime(self.folder.path, (stat.st_atime, stat.st_mtime + 10))
+        snapshot = Snapshot(TEST_SITE, 'key')
+        assert sorted(snapshot.listing(self.folder.path, self.scan)) == [
+            ('new.html', self.folder.child('new.html'), False),
+            ('page.html', self.page.path, False)]
+        assert len(self.parsed) == 2
+
+    def test_forgets_files_that_are_no_longer_listed(self):
+        snapshot = Snapshot(TEST_SITE, 'key')
+        snapshot.read(self.page.path, 'text', self.parse)
+        snapshot.save()
+        snapshot = Snapshot(TEST_SITE, 'key')
+        snapshot.read(self.page.path, 'text', self.parse)
+        assert len(self.parsed) == 2
+
+    def test_discards_snapshot_with_another_key(self):
+        snapshot = Snapshot(TEST_SITE, 'key')
+        snapshot.read(self.page.path, 'text', self.parse)
+        snapshot.listing(self.folder.path, self.scan)
+        snapshot.save()
+        snapshot = Snapshot(TEST_SITE, 'other')
+        snapshot.read(self.page.path, 'text', self.parse)
+        assert len(self.parsed) == 3
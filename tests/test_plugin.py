@@ -313,14 +313,19 @@ class TestPlugins(object):
             gen.generate_all()
             begin_text_resource_stub.reset_mock()
             path = self.site.content.source_folder.child('about.html')
+            about = File(path)
+            about.write(about.read_all() + '\n')
             gen = Generator(self.site)
             gen.generate_resource_at_path(path, incremental=True)
 
             called_with_resources = sorted(
                 [arg[0][0].path for arg in
                     begin_text_resource_stub.call_args_list])
-            assert begin_text_resource_stub.call_count == 1
-            assert called_with_resources[0] == path
+            # The modified source is preprocessed once when its
+            # references are read to record its dependencies and once
+            # more when it is rendered.
+            assert begin_text_resource_stub.call_count == 2
+            assert set(called_with_resources) == set([path])
 
     def test_generator_template_begin_binary_resource_called(self):
 
@@ -364,6 +369,24 @@ class TestPlugins(object):
             self.site.config.deploy_root_path).child('about.html'))
         assert about.read_all() == "Jam"
 
+    def test_proxy_dispatches_to_overridden_handlers(self):
+        self.site.config.plugins = [
+            'test_plugin.PluginLoaderStub',
+            'test_plugin.ConstantReturnPlugin'
+        ]
+        gen = Generator(self.site)
+        stub, constant = self.site.plugins
+        handlers = gen.events.get_handlers('begin_text_resource')
+        assert [plugin for plugin, _, _ in handlers] == [constant]
+        assert not gen.events.get_handlers('site_complete')
+        assert len(gen.events.get_handlers('template_loaded')) == 2
+
+        self.site.config.plugins = ['test_plugin.NoReturnPlugin']
+        Plugin.load_all(self.site)
+        handlers = gen.events.get_handlers('begin_text_resource')
+        assert [plugin.__class__ for plugin, _, _ in handlers] == [
+            NoReturnPlugin]
+
     def test_plugin_filters_begin_text_resource(self):
         def empty_return(self, resource, text=''):
             return text
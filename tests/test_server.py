@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Use nose
+`$ pip install nose`
+`$ nosetests`
+"""
+import time
+
+from hyde.server import HydeWebServer
+from hyde.site import Site
+
+from fswrap import File, Folder
+
+TEST_SITE = File(__file__).parent.child_folder('_test')
+
+
+class TestHydeWebServer(object):
+
+    def setUp(self):
+        TEST_SITE.make()
+        TEST_SITE.parent.child_folder(
+            'sites/test_jinja').copy_contents_to(TEST_SITE)
+        self.server = HydeWebServer(Site(TEST_SITE), '127.0.0.1', 0)
+        self.deploy = Folder(self.server.site.config.deploy_root_path)
+
+    def tearDown(self):
+        self.server.server_close()
+        if self.server.watcher:
+            self.server.watcher.stop()
+        TEST_SITE.delete()
+
+    def test_refresh_generates_affected_resources(self):
+        self.server.refresh()
+        assert File(self.deploy.child('about.html')).exists
+        generator = self.server.generator
+
+        time.sleep(0.01)
+        layout = File(TEST_SITE.child('layout/blog/post.html'))
+        layout.write(layout.read_all().replace(
+            '{% block main %}', '{% block main %}<!-- changed -->'))
+        self.server.refresh()
+        assert generator.stats['generated'] == 1
+        post = File(self.deploy.child(
+            'blog/2010/december/merry-christmas.html'))
+        assert '<!-- changed -->' in post.read_all()
+
+        File(TEST_SITE.child('content/new.html')).write(
+            '{% extends "base.html" %}')
+        File(TEST_SITE.child('content/about.html')).delete()
+        self.server.refresh()
+        assert File(self.deploy.child('new.html')).exists
+        assert not File(self.deploy.child('about.html')).exists
+
+    def test_polling_happens_outside_the_requests(self):
+        self.server.poll = True
+        self.server.refresh()
+        observer = self.server.watcher.observer
+        assert self.server.polling
+
+        time.sleep(0.01)
+        about = File(TEST_SITE.child('content/about.html'))
+        about.write(about.read_all().replace('Hi!', '<!-- changed -->'))
+        deadline = time.time() + 5
+        while not self.server.changes[0] and time.time() < deadline:
+            time.sleep(0.05)
+
+        def scan():
+            raise AssertionError("The request scanned the site")
+        self.server.stop_polling.set()
+        self.server.polling.join()
+        observer.take_snapshot = scan
+        self.server.refresh()
+        assert '<!-- changed -->' in File(
+            self.deploy.child('about.html')).read_all()
+        self.server.refresh()
+        assert self.server.generator.stats['generated'] == 1
@@ -5,10 +5,11 @@ Use nose
 `$ nosetests`
 """
 import yaml
+from fnmatch import fnmatch
 
 from hyde._compat import quote
 from hyde.model import Config
-from hyde.site import Node, RootNode, Site
+from hyde.site import Node, Resource, RootNode, Site, SourceCache
 
 from fswrap import File, Folder
 
@@ -106,6 +107,46 @@ def test_load():
     assert not s.content.resource_from_relative_path('/happy-festivus.html')
 
 
+def _load_with_walker(site):
+    content = site.content
+    with content.source_folder.walker as walker:
+        @walker.folder_visitor
+        def visit_folder(folder):
+            if any(fnmatch(folder.name, p) for p in site.config.ignore):
+                return False
+            content.add_node(folder)
+
+        @walker.file_visitor
+        def visit_file(afile):
+            if not any(fnmatch(afile.name, p) for p in site.config.ignore):
+                content.add_resource(afile)
+
+
+def _describe(content):
+    return (sorted(content.node_map),
+            sorted(content.resource_map),
+            sorted((str(r.node.source_folder), r.simple_copy)
+                   for r in content.resource_map.values()),
+            sorted((str(n.parent.source_folder), len(n.child_nodes),
+                    len(n.resources))
+                   for n in content.node_map.values()))
+
+
+def test_load_matches_walker():
+    config = Config(TEST_SITE_ROOT, config_dict=dict(
+        ignore=['*.ico', 'css'], simple_copy=['blog/*/*.html']))
+    expected = Site(TEST_SITE_ROOT, config)
+    _load_with_walker(expected)
+    assert expected.content.resource_map
+    for threads in (1, 4):
+        config.load_threads = threads
+        s = Site(TEST_SITE_ROOT, config)
+        s.load()
+        assert _describe(s.content) == _describe(expected.content)
+        s.load()
+        assert _describe(s.content) == _describe(expected.content)
+
+
 def test_walk_resources():
     s = Site(TEST_SITE_ROOT)
     s.load()
@@ -124,6 +165,25 @@ def test_walk_resources():
     assert pages == expected
 
 
+def test_walk_is_sorted_for_any_insertion_order():
+    s = Site(TEST_SITE_ROOT)
+    s.load()
+    expected_nodes = [node.path for node in s.content.walk()]
+    expected = [resource.path for resource in s.content.walk_resources()]
+    r = RootNode(TEST_SITE_ROOT.child_folder('content'), s)
+    for path in reversed(expected):
+        r.add_resource(path)
+    assert [node.path for node in r.walk()] == expected_nodes
+    assert [resource.path for resource in r.walk_resources()] == expected
+    about = r.resource_from_relative_path('about.html')
+    page = Resource(about.source_file, about.node)
+    about.node.resources += [page]
+    resources = list(r.walk_resources())
+    assert resources.index(page) == resources.index(about) + 1
+    assert [resource.path for resource in resources if resource is not page] \
+        == expected
+
+
 def test_contains_resource():
     s = Site(TEST_SITE_ROOT)
     s.load()
@@ -151,6 +211,32 @@ def test_resource_slug():
     assert resource.slug == 'merry-christmas'
 
 
+def test_resource_source_file():
+    s = Site(TEST_SITE_ROOT)
+    s.load()
+    path = 'blog/2010/december/merry-christmas.html'
+    resource = s.content.resource_from_relative_path(path)
+    afile = File(TEST_SITE_ROOT.child('content/' + path))
+    assert resource.source_file == afile
+    assert resource.source == afile
+    assert resource.path == afile.path
+    assert resource.name == 'merry-christmas.html'
+    assert resource.relative_path == path
+    assert resource.site == s
+
+
+def test_resource_extra_attributes():
+    s = Site(TEST_SITE_ROOT)
+    s.load()
+    resource = s.content.resource_from_relative_path('about.html')
+    assert not hasattr(resource, 'tags')
+    resource.tags = ['a', 'b']
+    assert resource.tags == ['a', 'b']
+    node = resource.node
+    node.meta = 'node meta'
+    assert node.meta == 'node meta'
+
+
 def test_get_resource_from_relative_deploy_path():
     s = Site(TEST_SITE_ROOT)
     s.load()
@@ -193,6 +279,25 @@ def test_relative_deploy_path_override():
             assert page.relative_deploy_path == Folder(page.relative_path)
 
 
+def test_urls_follow_deploy_path_and_config():
+    s = Site(TEST_SITE_ROOT)
+    s.load()
+    res = s.content.resource_from_relative_path('crossdomain.xml')
+    assert res.url == '/crossdomain.xml'
+    assert res.full_url == '/crossdomain.xml'
+    res.relative_deploy_path = 'policies/crossdomain.xml'
+    assert res.url == '/policies/crossdomain.xml'
+    assert res.full_url == '/policies/crossdomain.xml'
+    s.config.base_url = 'http://example.com/site'
+    assert res.url == '/policies/crossdomain.xml'
+    assert res.full_url == \
+        'http://example.com/site/policies/crossdomain.xml'
+    s.config = Config(TEST_SITE_ROOT, config_dict=dict(base_url='/en'))
+    assert res.full_url == '/en/policies/crossdomain.xml'
+    node = s.content.node_from_relative_path('blog/2010/december')
+    assert node.full_url == '/en/blog/2010/december'
+
+
 class TestSiteWithConfig(object):
 
     @classmethod
@@ -275,6 +380,27 @@ class TestSiteWithConfig(object):
         full_url = s.full_url(path)
         assert full_url == "/" + path
 
+    def test_full_url_follows_url_settings(self):
+        c = Config(self.SITE_PATH, config_dict=self.config.to_dict())
+        s = Site(self.SITE_PATH, config=c)
+        s.load()
+        path = 'media/css/site.css'
+        assert s.full_url(path) == "/" + path
+        assert s.full_url('http://example.com/a.css') == \
+            'http://example.com/a.css'
+        assert not s.is_media('media')
+        assert not s.is_media('mediafile.css')
+        assert s.is_media('blog/../media/css/site.css')
+        s.config.media_url = 'http://media.example.com'
+        assert s.full_url(path) == 'http://media.example.com/css/site.css'
+        s.config.media_root = 'blog'
+        assert s.full_url(path) == "/" + path
+        assert s.full_url('blog/2010') == 'http://media.example.com/2010'
+        s.url_cache_size = 2
+        for name in ('a', 'b', 'c'):
+            assert s.full_url(name) == '/' + name
+        assert len(s.url_cache()) <= 2
+
     def test_media_url_from_resource(self):
         s = Site(self.SITE_PATH, config=self.config)
         s.load()
@@ -314,3 +440,124 @@ class TestSiteWithConfig(object):
         assert not blog_node
         git_node = s.content.node_from_relative_path('.git')
         assert not git_node
+
+
+class TestChangeSet(object):
+
+    def setUp(self):
+        self.SITE_PATH = File(__file__).parent.child_folder('_test')
+        self.SITE_PATH.make()
+        TEST_SITE_ROOT.copy_contents_to(self.SITE_PATH)
+        self.site = Site(self.SITE_PATH)
+        self.site.load()
+        self.content = self.site.content
+        self.folder = self.content.source_folder
+
+    def tearDown(self):
+        self.SITE_PATH.delete()
+
+    def assert_same_as_reload(self):
+        site = Site(self.SITE_PATH)
+        site.load()
+        assert _describe(self.content) == _describe(site.content)
+        assert [resource.path for resource in self.content.walk_resources()] \
+            == [resource.path for resource in site.content.walk_resources()]
+
+    def test_adds_files_and_folders(self):
+        File(self.folder.child('new.html')).write('new')
+        folder = self.folder.child_folder('blog/2011/january')
+        folder.make()
+        File(folder.child('post.html')).write('post')
+        File(folder.child('notes.html~')).write('ignored')
+        added, removed = self.content.apply_changes(
+            created=[self.folder.child('new.html'),
+                     self.folder.child('blog/2011')])
+        assert not removed
+        assert sorted(resource.relative_path for resource in added) == [
+            'blog/2011/january/post.html', 'new.html']
+        node = self.content.node_from_relative_path('blog/2011')
+        assert node.parent is self.content.node_from_relative_path('blog')
+        self.assert_same_as_reload()
+
+    def test_removes_files_and_folders(self):
+        File(self.folder.child('about.html')).delete()
+        self.folder.child_folder('blog').delete()
+        added, removed = self.content.apply_changes(
+            deleted=[self.folder.child('about.html'),
+                     self.folder.child('blog')])
+        assert not added
+        assert 'blog/2010/december/merry-christmas.html' in [
+            resource.relative_path for resource in removed]
+        assert not self.content.resource_from_relative_path('about.html')
+        assert not self.content.node_from_relative_path('blog/2010')
+        self.assert_same_as_reload()
+
+    def test_moves_files_and_folders(self):
+        blog = self.folder.child_folder('blog')
+        blog.rename_to('posts')
+        added, removed = self.content.move(
+            blog.path, self.folder.child('posts'))
+        assert [resource.relative_path for resource in added] == [
+            resource.relative_path.replace('blog', 'posts', 1)
+            for resource in removed]
+        resource = self.content.resource_from_relative_path(
+            'posts/2010/december/merry-christmas.html')
+        assert resource.node.relative_path == 'posts/2010/december'
+        assert resource.url == '/posts/2010/december/merry-christmas.html'
+        self.assert_same_as_reload()
+
+    def test_forgets_changed_deploy_paths(self):
+        resource = self.content.resource_from_relative_path('about.html')
+        resource.relative_deploy_path = 'about/index.html'
+        assert self.content.resource_from_relative_deploy_path(
+            'about/index.html') is resource
+        self.content.remove_resource(resource.path)
+        assert not self.content.resource_from_relative_deploy_path(
+            'about/index.html')
+
+
+class TestSourceCache(object):
+
+    def setUp(self):
+        self.folder = File(__file__).parent.child_folder('_test')
+        self.folder.make()
+
+    def tearDown(self):
+        self.folder.delete()
+
+    def test_reads_file_once(self):
+        afile = File(self.folder.child('a.txt'))
+        afile.write('abc')
+        cache = SourceCache(100)
+        assert cache.read(afile) == 'abc'
+        assert cache.read(afile) == 'abc'
+        assert cache.misses == 1
+        assert cache.hits == 1
+
+    def test_reads_changed_file_again(self):
+        afile = File(self.folder.child('a.txt'))
+        afile.write('abc')
+        cache = SourceCache(100)
+        cache.read(afile)
+        afile.write('abcd')
+        assert cache.read(afile) == 'abcd'
+        assert cache.misses == 2
+        assert cache.size == 4
+
+    def test_evicts_least_recently_used(self):
+        files = []
+        for name in ('a', 'b', 'c'):
+            afile = File(self.folder.child(name + '.txt'))
+            afile.write(name * 4)
+            files.append(afile)
+        cache = SourceCache(10)
+        cache.read(files[0])
+        cache.read(files[1])
+        cache.read(files[0])
+        cache.read(files[2])
+        assert list(cache.entries) == [files[0].path, files[2].path]
+        assert cache.size == 8
+        big = File(self.folder.child('big.txt'))
+        big.write('x' * 20)
+        assert cache.read(big) == 'x' * 20
+        assert big.path not in cache.entries
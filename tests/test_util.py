@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Use nose
+`$ pip install nose`
+`$ nosetests`
+"""
+from fnmatch import fnmatch
+
+from hyde.util import GlobMatcher, glob_matcher
+
+
+PATTERNS = ['*~', '*.bak', '.git', 'media/*', '*.min.*', 'page?.html',
+            '[abc]*.txt', 'blog/*/*.html', '*', 'robots.txt']
+
+NAMES = ['about.html', 'about.html~', 'site.bak', '.git', '.gitignore',
+         'media/css/site.css', 'mediax', 'jquery.min.js', 'page1.html',
+         'page10.html', 'a.txt', 'd.txt', 'blog/2010/post.html',
+         'blog/post.html', 'robots.txt', 'robots.txt.bak', '']
+
+
+def test_glob_matcher_matches_like_fnmatch():
+    for count in range(len(PATTERNS) + 1):
+        patterns = PATTERNS[:count]
+        matcher = GlobMatcher(patterns)
+        for name in NAMES:
+            expected = any(fnmatch(name, pattern) for pattern in patterns)
+            assert matcher(name) == expected, (patterns, name)
+
+
+def test_glob_matcher_uses_fast_paths():
+    matcher = GlobMatcher(['.git', '*.bak', 'draft*', 'page?.html'])
+    assert matcher.exact == frozenset(['.git'])
+    assert matcher.suffixes == ('.bak',)
+    assert matcher.prefixes == ('draft',)
+    assert matcher.regex
+    assert not GlobMatcher(['*.bak']).regex
+
+
+def test_glob_matcher_is_reused():
+    assert glob_matcher(['*.bak', '.git']) is glob_matcher(('*.bak', '.git'))
+    assert glob_matcher(['*.bak']) is not glob_matcher(['*.git'])
+    assert not glob_matcher(None)('name')
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Use nose
+`$ pip install nose`
+`$ nosetests`
+"""
+import sys
+import time
+
+from hyde.generator import Generator
+from hyde.site import Site
+from hyde.watcher import Watcher
+
+from fswrap import File, Folder
+from nose.plugins.skip import SkipTest
+
+TEST_SITE = File(__file__).parent.child_folder('_test')
+
+
+class TestWatcher(object):
+
+    poll = False
+
+    def setUp(self):
+        if not self.poll and not sys.platform.startswith('linux'):
+            raise SkipTest("inotify is only available on Linux")
+        TEST_SITE.make()
+        TEST_SITE.parent.child_folder(
+            'sites/test_jinja').copy_contents_to(TEST_SITE)
+        self.site = Site(TEST_SITE)
+        self.site.load()
+        self.gen = Generator(self.site)
+        self.watcher = Watcher(self.site, self.gen, poll=self.poll,
+                               interval=0.05)
+        self.watcher.start()
+        self.deploy = Folder(self.site.config.deploy_root_path)
+
+    def tearDown(self):
+        if getattr(self, 'watcher', None):
+            self.watcher.stop()
+        TEST_SITE.delete()
+
+    def change(self, afile, text):
+        # Make sure the change is visible to polling.
+        time.sleep(0.01)
+        afile.write(text)
+
+    def test_regenerates_changed_resource(self):
+        about = File(TEST_SITE.child('content/about.html'))
+        self.change(about, about.read_all().replace(
+            '{% block main %}', '{% block main %}Updated by the watcher'))
+        assert self.watcher.run_once(timeout=5)
+        assert self.gen.stats['generated'] == 1
+        assert 'Updated by the watcher' in File(
+            self.deploy.child('about.html')).read_all()
+
+    def test_regenerates_resources_using_changed_layout(self):
+        layout = File(TEST_SITE.child('layout/blog/post.html'))
+        self.change(layout, layout.read_all().replace(
+            '{% block main %}', '{% block main %}<!-- changed -->'))
+        assert self.watcher.run_once(timeout=5)
+        assert self.gen.stats['generated'] == 1
+        post = File(self.deploy.child(
+            'blog/2010/december/merry-christmas.html'))
+        assert '<!-- changed -->' in post.read_all()
+
+    def test_reloads_site_for_new_resources(self):
+        new = File(TEST_SITE.child('content/new.html'))
+        self.change(new, '{% extends "base.html" %}')
+        assert self.watcher.run_once(timeout=5)
+        assert self.site.content.resource_from_relative_path('new.html')
+        assert File(self.deploy.child('new.html')).exists
+        assert self.gen.stats['generated'] == 1
+
+    def test_removes_deleted_resources(self):
+        File(TEST_SITE.child('content/about.html')).delete()
+        assert self.watcher.run_once(timeout=5)
+        assert not self.site.content.resource_from_relative_path('about.html')
+        assert not File(self.deploy.child('about.html')).exists
+
+    def test_ignores_deploy_folder(self):
+        File(self.deploy.child('other.html')).write('other')
+        assert not self.watcher.run_once(timeout=0.2)
+
+
+class TestPollingWatcher(TestWatcher):
+
+    poll = True